@@ -10,27 +10,166 @@
 
 #Output is an excel sheet where each column represent duplicate files
 
+#By default the files are compared where they are, and only the files that turn out to be duplicates are placed
+#in the "<name> - duplicate check" folder, as reflinks or hardlinks where the drive supports them (plain copies
+#otherwise). A hardlink is the same file as the original, so annotate a copy of it rather than the link itself.
+#Untick "Compare in place" to copy every same-named file into that folder first, as before.
+
+#Several files can be checked in one run: select them all with Browse, or type their names separated by ";".
+#The folder is listed once into "PDF Compare file index.json" in the selected folder, and later runs only
+#re-list the subfolders that have changed since.
+
+#"Check All Duplicated Names" runs the check for every file name found in more than one package folder, on a pool
+#of worker processes (BATCH_WORKERS), and writes one "duplicate_comparison_batch.csv" in the selected folder.
+#No duplicate check folders are created in this mode.
+
+#The checks run in the background: the window shows a progress bar and the time taken by each stage, and
+#the Cancel button stops the run after the file name currently being checked.
+
+#Extracted page text is cached in "PDF Compare text cache.sqlite" in the selected folder, so files that have
+#not changed are not extracted again on the next run. Delete the file to start fresh.
+
 #Mohammed Hashem - 2024-03-27
 
 ########################################################################
-from tkinter import Tk, Label, Entry, Button, messagebox
-from tkinter.filedialog import askopenfilename, askdirectory
+from tkinter import Tk, Label, Entry, Button, Checkbutton, BooleanVar, messagebox
+from tkinter.ttk import Progressbar
+from tkinter.filedialog import askopenfilenames, askdirectory
 from pathlib import Path
 from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NullObject, StreamObject
 import csv
+import hashlib
+import json
+import os
+import queue
 import shutil
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import freeze_support
+
+# Number of extracted pages kept in memory, and the on-disk cache kept in the selected folder
+TEXT_CACHE_SIZE = 2048
+# New pages are written to the on-disk cache in batches of this many, and a writer waits this long for another to finish
+TEXT_CACHE_WRITE_BATCH = 256
+TEXT_CACHE_TIMEOUT = 60
+USE_DISK_TEXT_CACHE = True
+TEXT_CACHE_FILE_NAME = "PDF Compare text cache.sqlite"
+
+# Listing of the selected folder, kept in the selected folder and refreshed on each run
+FILENAME_INDEX_FILE_NAME = "PDF Compare file index.json"
+
+# Compare the original files and only link the reported duplicates into the duplicate check folder
+COMPARE_IN_PLACE = True
+
+# Worker processes used by the batch check of every duplicated file name
+BATCH_WORKERS = os.cpu_count() or 1
+BATCH_OUTPUT_FILE_NAME = "duplicate_comparison_batch"
+
+# Linux ioctl that clones a file's blocks copy-on-write (reflink), on filesystems such as Btrfs and XFS
+FICLONE = 0x40049409
+
+class FilenameIndex:
+    """
+    Index of the PDF files under a folder, mapping each file stem to the paths that have it.
+
+    The folder is listed once with os.scandir. The listing of every subfolder is stored with the
+    subfolder's modification time, so refresh only re-lists subfolders where files were added,
+    removed or renamed since. The index can be saved to and loaded from a JSON file.
+    """
 
-def find_files_with_same_name(parent_folder, filename):
+    def __init__(self, root_folder):
+        self.root_folder = os.path.abspath(root_folder)
+        self.directories = {}
+        self.stems = {}
+
+    @classmethod
+    def load(cls, root_folder, index_path):
+        """
+        Load a saved index and refresh it, or build a new one if there is no usable saved index.
+        """
+        index = cls(root_folder)
+        try:
+            with open(index_path, 'r') as index_file:
+                saved = json.load(index_file)
+            if saved["root_folder"] == index.root_folder:
+                index.directories = saved["directories"]
+        except (OSError, ValueError, KeyError):
+            pass
+        index.refresh()
+        return index
+
+    def save(self, index_path):
+        with open(index_path, 'w') as index_file:
+            json.dump({"root_folder": self.root_folder, "directories": self.directories}, index_file)
+
+    def _scan_directory(self, directory, mtime_ns):
+        files = []
+        subfolders = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.name)
+                elif entry.name.endswith(".pdf") and entry.is_file():
+                    files.append(entry.name)
+        return {"mtime_ns": mtime_ns, "files": files, "subfolders": subfolders}
+
+    def refresh(self):
+        """
+        Bring the index up to date, re-listing only the subfolders whose modification time changed.
+
+        Returns:
+            int: The number of subfolders that were re-listed.
+        """
+        directories = {}
+        rescanned = 0
+        pending = [self.root_folder]
+        while pending:
+            directory = pending.pop()
+            try:
+                # Read the time before listing, so changes made during the listing are picked up next time
+                mtime_ns = os.stat(directory).st_mtime_ns
+                listing = self.directories.get(directory)
+                if listing is None or listing["mtime_ns"] != mtime_ns:
+                    listing = self._scan_directory(directory, mtime_ns)
+                    rescanned += 1
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            directories[directory] = listing
+            pending.extend(os.path.join(directory, name) for name in listing["subfolders"])
+
+        self.directories = directories
+        self.stems = {}
+        for directory, listing in directories.items():
+            for name in listing["files"]:
+                file_path = Path(directory) / name
+                self.stems.setdefault(file_path.stem, []).append(file_path)
+        return rescanned
+
+    def lookup(self, filename):
+        """
+        Return the paths of the PDF files whose stem is filename.
+        """
+        return list(self.stems.get(filename, []))
+
+def find_files_with_same_name(parent_folder, filename, index=None):
     """
     Find files with the same name within a given parent folder.
 
     Args:
         parent_folder (str): The path to the parent folder.
         filename (str): The filename to search for.
+        index (FilenameIndex): Optional index of parent_folder, used instead of walking the folder.
 
     Returns:
         list: A list of paths to files with the specified filename.
     """
+    if index is not None:
+        return index.lookup(filename)
     parent_path = Path(parent_folder)
     file_paths = []
     
@@ -50,6 +189,79 @@ def generate_pckg_short_name(original_name):
 
 
 
+def staged_file_name(file_path):
+    """
+    Return the name a file is given in the duplicate check folder: its stem followed by the short package name.
+
+    Args:
+        file_path (Path): The path to the file, inside its package folder.
+
+    Returns:
+        str: The renamed file name.
+    """
+    # Get the first parent folder name
+    first_parent_folder = file_path.parents[0].name
+    pckg_suffix = generate_pckg_short_name(first_parent_folder)
+    return f"{file_path.stem}_{pckg_suffix}{file_path.suffix}"
+
+def staged_file_names(file_paths_list):
+    """
+    Give every file a distinct name in the duplicate check folder.
+
+    Files whose package folders have the same short package name would get the same staged name.
+    The first keeps it and the others get " (2)", " (3)" and so on before the extension.
+
+    Args:
+        file_paths_list (list): A list of paths to the files with the same name.
+
+    Returns:
+        tuple: A dict mapping each path to its staged name, and the sorted list of the staged names
+            that were shared by more than one file.
+    """
+    staged_names = {}
+    name_counts = Counter()
+    for current_path in file_paths_list:
+        new_filename = staged_file_name(current_path)
+        name_counts[new_filename] += 1
+        if name_counts[new_filename] > 1:
+            stem, suffix = os.path.splitext(new_filename)
+            new_filename = f"{stem} ({name_counts[new_filename]}){suffix}"
+        staged_names[current_path] = new_filename
+    collisions = sorted(name for name, count in name_counts.items() if count > 1)
+    return staged_names, collisions
+
+def link_or_copy(source_path, destination_path):
+    """
+    Place a file at a new path without copying its data where the filesystem allows it.
+
+    Tries a reflink (copy-on-write clone), then a hardlink, then falls back to a normal copy.
+
+    Args:
+        source_path (Path): The path to the existing file.
+        destination_path (Path): The path to create. An existing file there is replaced.
+
+    Returns:
+        str: "reflink", "hardlink" or "copy", depending on how the file was placed.
+    """
+    if destination_path.exists():
+        destination_path.unlink()
+
+    try:
+        import fcntl
+        with open(source_path, 'rb') as source, open(destination_path, 'wb') as destination:
+            fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+        return "reflink"
+    except (ImportError, OSError):
+        if destination_path.exists():
+            destination_path.unlink()
+
+    try:
+        os.link(source_path, destination_path)
+        return "hardlink"
+    except OSError:
+        shutil.copy(source_path, destination_path)
+        return "copy"
+
 def copy_and_rename_files(file_paths_list, parent_folder, file_to_check):
     """
     Copy files from a list to a new folder and rename them with a specific suffix.
@@ -72,37 +284,219 @@ def copy_and_rename_files(file_paths_list, parent_folder, file_to_check):
     destination_folder.mkdir(parents=True, exist_ok=True)
     
     # Copy and rename files
+    staged_names = staged_file_names(file_paths_list)[0]
     for current_path in file_paths_list:
-        # Get the first parent folder name
-        first_parent_folder = current_path.parents[0].name
-        
-        pckg_suffix =  generate_pckg_short_name(first_parent_folder)
-        # print(f"{pckg_suffix=}")
-
+        # Destination path with new filename
+        destination_file_path = destination_folder / staged_names[current_path]
 
+        # An earlier in-place run may have left a hardlink to an original file here, so never copy through it
+        if destination_file_path.exists():
+            destination_file_path.unlink()
 
-        # Construct the new filename with suffix
-        new_filename = f"{current_path.stem}_{pckg_suffix}{current_path.suffix}"
-        # print(f"{new_filename=}")
-        # Destination path with new filename
-        destination_file_path = destination_folder / new_filename
-        
         # Copy the file and rename it
         shutil.copy(current_path, destination_file_path)
 
     return destination_folder
 
-def compare_pdfs(pdf1, pdf2):
+def hash_file(file_path, block_size=1024 * 1024):
     """
-    Compare the content of two PDF files.
+    Generate a BLAKE2b hash for a file.
+
+    Args:
+        file_path (str): The path to the file.
+        block_size (int): The number of bytes read per block.
+
+    Returns:
+        str: The BLAKE2b hash of the file.
+    """
+    file_hash = hashlib.blake2b()
+    with open(file_path, 'rb') as f:
+        for byte_block in iter(lambda: f.read(block_size), b""):
+            file_hash.update(byte_block)
+    return file_hash.hexdigest()
+
+class TextExtractionCache:
+    """
+    Cache of extracted page text, keyed by the file's content digest and the page index.
+
+    Recently used pages are kept in an in-memory LRU of at most max_pages entries. When a
+    cache_path is given, every page is also stored in a SQLite file so later runs can reuse it.
+    Copies and renamed files share entries because the key is the file content, not its path.
+    New pages are written in short batched transactions, so several processes can share the file.
+    """
+
+    def __init__(self, max_pages=TEXT_CACHE_SIZE, cache_path=None):
+        self.max_pages = max_pages
+        self.pages = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.connection = None
+        self.pending = []
+        if cache_path:
+            self.connection = sqlite3.connect(cache_path, timeout=TEXT_CACHE_TIMEOUT)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS page_text ("
+                "file_digest TEXT, page_index INTEGER, text TEXT, PRIMARY KEY (file_digest, page_index))"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _remember(self, key, text):
+        self.pages[key] = text
+        self.pages.move_to_end(key)
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+
+    def get_page_text(self, file_digest, page_index, page):
+        """
+        Return the text of a page, extracting it only if it is not cached.
+
+        Args:
+            file_digest (str): The hash of the PDF file, see hash_file.
+            page_index (int): The index of the page in the file.
+            page (PageObject): The page, used only on a cache miss.
+
+        Returns:
+            str: The extracted text of the page.
+        """
+        key = (file_digest, page_index)
+        if key in self.pages:
+            self.hits += 1
+            self.pages.move_to_end(key)
+            return self.pages[key]
+
+        if self.connection is not None:
+            row = self.connection.execute(
+                "SELECT text FROM page_text WHERE file_digest = ? AND page_index = ?", key
+            ).fetchone()
+            if row:
+                self.hits += 1
+                self._remember(key, row[0])
+                return row[0]
+
+        self.misses += 1
+        text = page.extract_text()
+        self._remember(key, text)
+        if self.connection is not None:
+            self.pending.append((*key, text))
+            if len(self.pending) >= TEXT_CACHE_WRITE_BATCH:
+                self.flush()
+        return text
+
+    def flush(self):
+        """
+        Write the pages extracted since the last flush to the on-disk cache.
+        """
+        if self.connection is not None and self.pending:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO page_text VALUES (?, ?, ?)", self.pending)
+            self.pending = []
+
+    def close(self):
+        if self.connection is not None:
+            self.flush()
+            self.connection.close()
+            self.connection = None
+
+# Shared in-memory cache used when no other cache is passed in
+default_text_cache = TextExtractionCache()
+
+def page_sizes(reader):
+    """
+    Return the MediaBox width and height of every page of a PDF.
+    """
+    return tuple((round(float(page.mediabox.width), 1), round(float(page.mediabox.height), 1)) for page in reader.pages)
+
+def resource_digest(obj, digest, seen):
+    """
+    Feed a PDF object into a digest, following indirect references and including raw stream data.
+
+    Indirect objects are numbered in the order they are first reached rather than by their
+    object numbers, so the same resources in two different files give the same digest.
+    """
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key in seen:
+            digest.update(f"R{seen[key]};".encode('ascii'))
+            return
+        seen[key] = len(seen)
+        obj = obj.get_object()
+    if isinstance(obj, DictionaryObject):
+        digest.update(b"<<")
+        for name in sorted(obj):
+            digest.update(name.encode('utf-8', 'surrogatepass') + b" ")
+            resource_digest(obj.raw_get(name), digest, seen)
+        digest.update(b">>")
+        if isinstance(obj, StreamObject):
+            digest.update(f"stream {len(obj._data)};".encode('ascii'))
+            digest.update(obj._data)
+    elif isinstance(obj, ArrayObject):
+        digest.update(b"[")
+        for item in obj:
+            resource_digest(item, digest, seen)
+        digest.update(b"]")
+    else:
+        digest.update(f"{type(obj).__name__}:{obj!r};".encode('utf-8', 'surrogatepass'))
+
+def content_stream_signature(reader):
+    """
+    Return the length and digest of the raw (still encoded) content streams of every page of a PDF,
+    together with the page resources they draw with.
+
+    The resources (fonts, form XObjects and so on) are followed recursively, because the same
+    content stream, such as "q /Fm0 Do Q", draws different text with different resources.
+    Pages with the same signature draw the same text, so matching signatures make text
+    extraction unnecessary. Different signatures do not prove the text differs.
+    """
+    signature = []
+    for page in reader.pages:
+        contents = page.get("/Contents")
+        contents = contents.get_object() if contents is not None else None
+        if contents is None or isinstance(contents, NullObject):
+            streams = []  # blank page
+        elif isinstance(contents, ArrayObject):
+            streams = contents
+        else:
+            streams = [contents]
+        stream_hash = hashlib.blake2b()
+        length = 0
+        for stream in streams:
+            data = stream.get_object()._data
+            stream_hash.update(data)
+            length += len(data)
+        resources_hash = hashlib.blake2b()
+        resource_digest(page.get("/Resources"), resources_hash, {})
+        signature.append((length, stream_hash.hexdigest(), resources_hash.hexdigest()))
+    return tuple(signature)
+
+def compare_pdfs_tiered(pdf1, pdf2, text_cache=None):
+    """
+    Compare the content of two PDF files, trying the cheapest checks first.
+
+    The tiers are, in order: identical file digest, page count, page sizes (MediaBox),
+    raw content streams with their page resources, and finally the extracted text of each page. PDFs whose pages
+    have different sizes are treated as different drawings even if their text matches.
 
     Args:
         pdf1 (str): The path to the first PDF file.
         pdf2 (str): The path to the second PDF file.
+        text_cache (TextExtractionCache): Cache of extracted page text, default_text_cache if not given.
 
     Returns:
-        bool: True if the content of the PDF files is identical, False otherwise.
+        tuple: True if the PDF files are identical, False otherwise, and the name of the tier
+            that decided ("digest", "page_count", "mediabox", "content_stream" or "text").
     """
+    text_cache = text_cache or default_text_cache
+    digest1 = hash_file(pdf1)
+    digest2 = hash_file(pdf2)
+    if digest1 == digest2:
+        return True, "digest"
+
     # Open the PDF files
     with open(pdf1, 'rb') as file1, open(pdf2, 'rb') as file2:
         # Create PdfFileReader objects
@@ -111,49 +505,182 @@ def compare_pdfs(pdf1, pdf2):
 
         # Check the number of pages
         if len(reader1.pages) != len(reader2.pages):
-            return False
+            return False, "page_count"
+
+        if page_sizes(reader1) != page_sizes(reader2):
+            return False, "mediabox"
+
+        if content_stream_signature(reader1) == content_stream_signature(reader2):
+            return True, "content_stream"
 
         # Check each page's content
         for page_num in range(len(reader1.pages)):
-            page1_text = reader1.pages[page_num].extract_text()
-            page2_text = reader2.pages[page_num].extract_text()
+            page1_text = text_cache.get_page_text(digest1, page_num, reader1.pages[page_num])
+            page2_text = text_cache.get_page_text(digest2, page_num, reader2.pages[page_num])
             if page1_text != page2_text:
-                return False
+                return False, "text"
+
+    return True, "text"
+
+def compare_pdfs(pdf1, pdf2, text_cache=None):
+    """
+    Compare the content of two PDF files.
+
+    Args:
+        pdf1 (str): The path to the first PDF file.
+        pdf2 (str): The path to the second PDF file.
+        text_cache (TextExtractionCache): Cache of extracted page text, default_text_cache if not given.
+
+    Returns:
+        bool: True if the content of the PDF files is identical, False otherwise.
+    """
+    is_identical, tier = compare_pdfs_tiered(pdf1, pdf2, text_cache)
+    return is_identical
+
+def pdf_fingerprint(pdf_path, text_cache=None, file_digest=None):
+    """
+    Reduce the extracted text of a PDF file to per-page digests and a whole-document digest.
+
+    Two PDF files have the same fingerprint exactly when their text matches page by page,
+    so each file only needs its text extracted once.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        text_cache (TextExtractionCache): Cache of extracted page text, default_text_cache if not given.
+        file_digest (str): The hash of the file if already known, see hash_file.
+
+    Returns:
+        tuple: The tuple of per-page text digests and the digest of the whole document.
+    """
+    text_cache = text_cache or default_text_cache
+    file_digest = file_digest or hash_file(pdf_path)
+    with open(pdf_path, 'rb') as file:
+        reader = PdfReader(file)
+        page_digests = tuple(
+            hashlib.blake2b(
+                text_cache.get_page_text(file_digest, page_index, page).encode('utf-8', 'surrogatepass')
+            ).hexdigest()
+            for page_index, page in enumerate(reader.pages)
+        )
+    document_digest = hashlib.blake2b(" ".join(page_digests).encode('ascii')).hexdigest()
+    return page_digests, document_digest
+
+def group_duplicate_pdfs(pdf_files, text_cache=None, tier_counts=None):
+    """
+    Group PDF files with identical content.
+
+    Files are grouped with the same cheap-first tiers as compare_pdfs_tiered: byte-identical
+    files are grouped by digest, files with a unique page count and page sizes need no further
+    work, files with matching raw content streams and page resources are grouped directly, and only the rest
+    have their text extracted, once per distinct file.
+
+    Args:
+        pdf_files (list): A list of paths to PDF files.
+        text_cache (TextExtractionCache): Cache of extracted page text, default_text_cache if not given.
+        tier_counts (Counter): Optional counter incremented with the tier that placed each file.
+
+    Returns:
+        list: A list of lists containing paths of duplicate PDF files, in input order.
+    """
+    if tier_counts is None:
+        tier_counts = Counter()
+
+    # Byte-identical files share one representative
+    file_digests = {pdf_file: hash_file(pdf_file) for pdf_file in pdf_files}
+    representatives = {}
+    for pdf_file in pdf_files:
+        representatives.setdefault(file_digests[pdf_file], pdf_file)
+
+    structure_buckets = {}
+    page_counts = Counter()
+    for pdf_file in representatives.values():
+        with open(pdf_file, 'rb') as file:
+            reader = PdfReader(file)
+            structure_key = (len(reader.pages), page_sizes(reader))
+            stream_key = content_stream_signature(reader)
+        page_counts[structure_key[0]] += 1
+        structure_buckets.setdefault(structure_key, {}).setdefault(stream_key, []).append(pdf_file)
+
+    group_keys = {}
+    for structure_key, stream_buckets in structure_buckets.items():
+        if len(stream_buckets) == 1:
+            # Every file in the bucket has the same content streams, or the bucket holds a single file
+            stream_key, bucket_files = next(iter(stream_buckets.items()))
+            if len(bucket_files) > 1:
+                tier = "content_stream"
+            elif page_counts[structure_key[0]] == 1:
+                tier = "page_count"
+            else:
+                tier = "mediabox"
+            for pdf_file in bucket_files:
+                group_keys[pdf_file] = (structure_key, stream_key)
+                tier_counts[tier] += 1
+            continue
+
+        for stream_key, bucket_files in stream_buckets.items():
+            page_digests, document_digest = pdf_fingerprint(bucket_files[0], text_cache, file_digests[bucket_files[0]])
+            for pdf_file in bucket_files:
+                group_keys[pdf_file] = (structure_key, document_digest)
+                tier_counts["text" if pdf_file == bucket_files[0] else "content_stream"] += 1
+
+    fingerprint_index = {}
+    for pdf_file in pdf_files:
+        representative = representatives[file_digests[pdf_file]]
+        if representative != pdf_file:
+            tier_counts["digest"] += 1
+        fingerprint_index.setdefault(group_keys[representative], []).append(pdf_file)
 
-    return True
+    return [group for group in fingerprint_index.values() if len(group) > 1]
 
-def check_duplicate_pdfs(folder_path):
+def check_duplicate_pdfs(folder_path, text_cache=None, tier_counts=None):
     """
     Check for duplicate PDF files within a folder based on their content.
 
     Args:
         folder_path (str): The path to the folder containing PDF files.
+        text_cache (TextExtractionCache): Cache of extracted page text, default_text_cache if not given.
+        tier_counts (Counter): Optional counter incremented with the tier that placed each file.
 
     Returns:
         list: A list of lists containing filenames of duplicate PDF files.
     """
-    duplicates = []
-
-    # Iterate over PDF files in the folder
     pdf_files = list(Path(folder_path).glob('*.pdf'))
-   
-    
-    while pdf_files:
-        current_pdf = pdf_files.pop(0)
-        
-        
-        current_duplicates = [current_pdf.name]
+    return [[pdf_file.name for pdf_file in group] for group in group_duplicate_pdfs(pdf_files, text_cache, tier_counts)]
+
+def check_duplicate_pdfs_in_place(file_paths_list, parent_folder, file_to_check, text_cache=None, tier_counts=None):
+    """
+    Check files for duplicates where they are, then place only the duplicates in the duplicate check folder.
+
+    Produces the same folder, file names and groups as copy_and_rename_files followed by
+    check_duplicate_pdfs, without copying the files that are not duplicates.
+
+    Args:
+        file_paths_list (list): A list of paths to the files with the same name.
+        parent_folder (str): The path to the parent folder.
+        file_to_check (str): The filename used for creating the destination folder and renaming files.
+        text_cache (TextExtractionCache): Cache of extracted page text, default_text_cache if not given.
+        tier_counts (Counter): Optional counter incremented with the tier that placed each file.
 
-        for pdf_file in pdf_files[:]:
-            
-            if compare_pdfs(str(current_pdf), str(pdf_file)):
-                current_duplicates.append(pdf_file.name)
-                pdf_files.remove(pdf_file)
+    Returns:
+        tuple: The path to the destination folder (None if there are fewer than two files)
+            and a list of lists containing filenames of duplicate PDF files.
+    """
+    if len(file_paths_list) < 2:
+        return None, []
+    destination_folder = Path(parent_folder) / f"{file_to_check} - duplicate check"
+    destination_folder.mkdir(parents=True, exist_ok=True)
 
-        if len(current_duplicates) > 1:
-            duplicates.append(current_duplicates)
+    # List the files in name order, as they would be listed in the duplicate check folder
+    staged_names = staged_file_names(file_paths_list)[0]
+    staged_paths = {name: current_path for current_path, name in staged_names.items()}
+    pdf_files = [staged_paths[name] for name in sorted(staged_paths) if name.endswith('.pdf')]
 
-    return duplicates
+    dupes = []
+    for group in group_duplicate_pdfs(pdf_files, text_cache, tier_counts):
+        dupes.append([staged_names[current_path] for current_path in group])
+        for current_path in group:
+            link_or_copy(current_path, destination_folder / staged_names[current_path])
+    return destination_folder, dupes
 
 def write_csv_from_list_of_lists(list_of_lists, output_folder, output_filename):
     """
@@ -173,6 +700,127 @@ def write_csv_from_list_of_lists(list_of_lists, output_folder, output_filename):
         for i in range(max_length):
             row = [inner_list[i] if i < len(inner_list) else '' for inner_list in list_of_lists]
             writer.writerow(row)
+
+def find_duplicated_file_names(index):
+    """
+    Find the PDF file names that appear in more than one package folder.
+
+    Args:
+        index (FilenameIndex): The index of the parent folder.
+
+    Returns:
+        list: The sorted file names (without extension).
+    """
+    return sorted(
+        stem for stem, file_paths in index.stems.items()
+        if len({file_path.parent for file_path in file_paths}) > 1
+    )
+
+def batch_check_file_name(file_to_check, file_paths_list, cache_path=None):
+    """
+    Worker for the batch check: group the files with one name by content, without copying or linking them.
+
+    Args:
+        file_to_check (str): The file name, without extension.
+        file_paths_list (list): A list of paths to the files with that name.
+        cache_path (Path): Optional, the on-disk text cache shared by the workers.
+
+    Returns:
+        tuple: The file name, a list of lists containing the renamed filenames of duplicate PDF files,
+            a Counter of the tiers that placed each file and of the text cache hits and misses,
+            and an error or collision message or None.
+    """
+    tier_counts = Counter()
+    try:
+        staged_names, collisions = staged_file_names(file_paths_list)
+        staged_paths = {name: current_path for current_path, name in staged_names.items()}
+        pdf_files = [staged_paths[name] for name in sorted(staged_paths)]
+        with TextExtractionCache(cache_path=cache_path) as text_cache:
+            try:
+                groups = group_duplicate_pdfs(pdf_files, text_cache, tier_counts)
+            finally:
+                tier_counts["cache_hits"] += text_cache.hits
+                tier_counts["cache_misses"] += text_cache.misses
+    except Exception as e:
+        return file_to_check, [], tier_counts, str(e)
+    message = None
+    if collisions:
+        message = "More than one file would be named " + ", ".join(f"'{name}'" for name in collisions) + ", the others were numbered"
+    return file_to_check, [[staged_names[current_path] for current_path in group] for group in groups], tier_counts, message
+
+def batch_short_name(file_to_check):
+    """
+    Return generate_pckg_short_name for a file name, or the file name itself if it does not have enough parts.
+    """
+    try:
+        return generate_pckg_short_name(file_to_check)
+    except IndexError:
+        return file_to_check
+
+class CheckCancelled(Exception):
+    """
+    Raised inside a running check when the user presses Cancel.
+    """
+
+def check_all_duplicated_file_names(index, workers=BATCH_WORKERS, progress=None, cancel_event=None, cache_path=None):
+    """
+    Run the duplicate check for every file name that appears in more than one package folder.
+
+    Each file name is checked in its own task on a pool of worker processes.
+
+    Args:
+        index (FilenameIndex): The index of the parent folder.
+        workers (int): The number of worker processes.
+        progress (callable): Optional, called as progress(done, total) as each file name finishes.
+        cancel_event (threading.Event): Optional, when set the tasks not yet started are dropped
+            and CheckCancelled is raised.
+        cache_path (Path): Optional, the on-disk text cache, opened by every worker.
+
+    Returns:
+        tuple: The rows for write_batch_csv, the number of file names checked, a Counter of the tiers
+            that placed each file and of the text cache hits and misses, and a list of error and collision messages.
+    """
+    file_names = find_duplicated_file_names(index)
+    results = {}
+    tier_counts = Counter()
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(batch_check_file_name, file_name, index.lookup(file_name), cache_path) for file_name in file_names]
+        for done, future in enumerate(as_completed(futures), start=1):
+            if cancel_event is not None and cancel_event.is_set():
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise CheckCancelled()
+            file_name, dupes, file_tier_counts, error = future.result()
+            results[file_name] = dupes
+            tier_counts.update(file_tier_counts)
+            if error:
+                errors.append(f"{file_name}: {error}")
+            if progress is not None:
+                progress(done, len(futures))
+
+    rows = []
+    for file_name in file_names:
+        for group_number, group in enumerate(results[file_name], start=1):
+            rows.append([batch_short_name(file_name), file_name, group_number] + group)
+    return rows, len(file_names), tier_counts, sorted(errors)
+
+def write_batch_csv(rows, output_folder):
+    """
+    Write the batch results to one CSV file, with one row per group of duplicates: the short
+    package name of the file name, the file name, the group number and the renamed files in the group.
+
+    Args:
+        rows (list): The rows returned by check_all_duplicated_file_names.
+        output_folder (str): The path to the folder where the CSV file will be saved.
+    """
+    if not rows:
+        return
+    max_length = max(len(row) for row in rows)
+    output_path = Path(output_folder) / (BATCH_OUTPUT_FILE_NAME + '.csv')
+    with open(output_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["Package short name", "File name", "Group"] + [f"Duplicate {i + 1}" for i in range(max_length - 3)])
+        writer.writerows(rows)
     
 
 
@@ -184,63 +832,257 @@ def browse_folder_path():
     folder_path_entry.insert(0, folder_path)
 
 def browse_file_to_check():
-     file_to_check = askopenfilename()
-     if file_to_check:
-        file_to_check = Path(file_to_check).name  # Extract only the filename
+    files_to_check = askopenfilenames()
+    if files_to_check:
+        files_to_check = "; ".join(Path(file_to_check).name for file_to_check in files_to_check)  # Extract only the filenames
         file_to_check_entry.delete(0, "end")
-        file_to_check_entry.insert(0, file_to_check)
+        file_to_check_entry.insert(0, files_to_check)
 
-def execute_script():
-    folder_path = folder_path_entry.get()
-    file_to_check = file_to_check_entry.get()
+def parse_files_to_check(files_to_check):
+    """
+    Split the "File to Check" entry into file names without extensions.
+
+    Args:
+        files_to_check (str): One or more file names separated by ";" or ",".
+
+    Returns:
+        list: The file names, without extensions and in entry order, with repeats removed.
+    """
+    file_names = []
+    for file_to_check in files_to_check.replace(",", ";").split(";"):
+        file_to_check = file_to_check.strip()
+        if "." in file_to_check:
+            file_to_check = file_to_check.split(".")[0]
+        if file_to_check and file_to_check not in file_names:
+            file_names.append(file_to_check)
+    return file_names
+
+def check_file_name(folder_path, file_to_check, index, text_cache, tier_counts, in_place):
+    """
+    Run the duplicate check for one file name and write its comparison CSV.
+
+    Returns:
+        str: The result message for this file name.
+    """
+    path_list = find_files_with_same_name(folder_path, file_to_check, index)
+    staged_names, collisions = staged_file_names(path_list)
+    if in_place:
+        destination_folder, dupes = check_duplicate_pdfs_in_place(
+            path_list, folder_path, file_to_check, text_cache, tier_counts
+        )
+    else:
+        destination_folder = copy_and_rename_files(path_list, folder_path, file_to_check)
+        if destination_folder:
+            dupes = check_duplicate_pdfs(destination_folder, text_cache, tier_counts)
+    if not destination_folder:
+        return f"{file_to_check}: No Duplicates, no output files created\n"
+
+    # If duplicates are found, continue with the rest of the script
+    message = ""  # Initialize an empty string to accumulate messages
+    for new_filename in collisions:
+        message += f"{file_to_check}: More than one file would be named '{new_filename}', the others were numbered\n"
+    pckg_short_name = generate_pckg_short_name(file_to_check)
+    output_filename = "duplicate_comparison_" + pckg_short_name
 
-    if "." in file_to_check:
-        file_to_check = file_to_check.split(".")[0]
+    if len(dupes) == 1 and len(dupes[0]) == len(path_list):
+        message += f"{file_to_check}: All instances of this file name are duplicates\n"
 
-    path_list = find_files_with_same_name(folder_path, file_to_check)
-    destination_folder = copy_and_rename_files(path_list, folder_path, file_to_check)
-    if destination_folder:
-        dupes = check_duplicate_pdfs(destination_folder)
+    write_csv_from_list_of_lists(dupes, destination_folder, output_filename)
+    message += f"{file_to_check}: Duplicate comparison file '{output_filename}.csv' has been created successfully\n"
+    return message
 
+@contextmanager
+def stage(name):
+    """
+    Show a stage of the background check in the window, and its time once it ends.
+    """
+    progress_queue.put(("stage", name))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        progress_queue.put(("timing", name, time.perf_counter() - start))
 
-        # If duplicates are found, continue with the rest of the script
-        message = ""  # Initialize an empty string to accumulate messages
-        pckg_short_name = generate_pckg_short_name(file_to_check)
-        output_filename = "duplicate_comparison_" + pckg_short_name
+def report_progress(done, total):
+    progress_queue.put(("progress", done, total))
+
+def load_index(folder_path):
+    with stage("Indexing folder"):
+        index_path = Path(folder_path) / FILENAME_INDEX_FILE_NAME
+        index = FilenameIndex.load(folder_path, index_path)
+        index.save(index_path)
+    return index
+
+def run_file_check(folder_path, files_to_check, in_place):
+    """
+    Background task behind the Execute button.
 
-        if len(dupes) == 1 and len(dupes[0]) == len(path_list):
-            message += "All instances of this file name are duplicates\n"
-        
-        # if len(path_list)>1:
-        write_csv_from_list_of_lists(dupes, destination_folder, output_filename)
-        message += f"Duplicate comparison file '{output_filename}.csv' has been created successfully\n"
-        messagebox.showinfo("Execution Result", message)
+    Returns:
+        str: The result message.
+    """
+    index = load_index(folder_path)
+
+    message = ""
+    cache_path = Path(folder_path) / TEXT_CACHE_FILE_NAME if USE_DISK_TEXT_CACHE else None
+    tier_counts = Counter()
+    with stage("Comparing files"), TextExtractionCache(cache_path=cache_path) as text_cache:
+        for done, file_to_check in enumerate(files_to_check):
+            if cancel_event.is_set():
+                raise CheckCancelled()
+            report_progress(done, len(files_to_check))
+            message += check_file_name(folder_path, file_to_check, index, text_cache, tier_counts, in_place)
+        report_progress(len(files_to_check), len(files_to_check))
+
+    message += "Execution complete\n"
+    message += f"Text cache: {text_cache.hits} pages reused, {text_cache.misses} pages extracted\n"
+    message += "Files decided by: " + ", ".join(f"{tier} {count}" for tier, count in tier_counts.items()) + "\n"
+    return message
+
+def run_batch_check(folder_path):
+    """
+    Background task behind the Check All Duplicated Names button.
+
+    Returns:
+        str: The result message.
+    """
+    index = load_index(folder_path)
+
+    cache_path = Path(folder_path) / TEXT_CACHE_FILE_NAME if USE_DISK_TEXT_CACHE else None
+    with stage("Comparing files"):
+        rows, checked, tier_counts, errors = check_all_duplicated_file_names(
+            index, progress=report_progress, cancel_event=cancel_event, cache_path=cache_path
+        )
+    cache_hits = tier_counts.pop("cache_hits", 0)
+    cache_misses = tier_counts.pop("cache_misses", 0)
+    with stage("Writing CSV"):
+        write_batch_csv(rows, folder_path)
+
+    message = f"Checked {checked} file names found in more than one package folder\n"
+    if rows:
+        message += f"{len(rows)} groups of duplicates listed in '{BATCH_OUTPUT_FILE_NAME}.csv'\n"
     else:
-        messagebox.showinfo("Execution Result", "No Duplicates\nExecution complete\nNo output files created")
+        message += "No Duplicates, no output file created\n"
+    message += f"Text cache: {cache_hits} pages reused, {cache_misses} pages extracted\n"
+    message += "Files decided by: " + ", ".join(f"{tier} {count}" for tier, count in tier_counts.items()) + "\n"
+    if errors:
+        message += f"{len(errors)} file names could not be checked or had files with the same renamed name:\n" + "\n".join(errors[:10]) + "\n"
+    return message
 
+def background_worker(task, args):
+    try:
+        progress_queue.put(("done", task(*args)))
+    except CheckCancelled:
+        progress_queue.put(("done", "Execution cancelled\n"))
+    except Exception as e:
+        progress_queue.put(("error", f"{type(e).__name__}: {e}"))
 
-    
+def run_in_background(task, *args):
+    """
+    Run task(*args) on a worker thread so the window stays responsive. Only one task runs at a time.
+    """
+    cancel_event.clear()
+    stage_timings.clear()
+    timings_label.config(text="")
+    progress_bar.config(mode="indeterminate")
+    progress_bar.start()
+    for button in run_buttons:
+        button.config(state="disabled")
+    cancel_button.config(state="normal")
+    threading.Thread(target=background_worker, args=(task, args), daemon=True).start()
+
+def finish_background_task():
+    progress_bar.stop()
+    progress_bar.config(mode="determinate", value=0)
+    status_label.config(text="")
+    for button in run_buttons:
+        button.config(state="normal")
+    cancel_button.config(state="disabled")
+
+def poll_progress_queue():
+    """
+    Apply the updates sent by the worker thread to the window. Runs on the Tk main thread every 100 ms.
+    """
+    while True:
+        try:
+            update = progress_queue.get_nowait()
+        except queue.Empty:
+            break
+        if update[0] == "stage":
+            status_label.config(text=f"{update[1]}...")
+        elif update[0] == "progress":
+            done, total = update[1], update[2]
+            progress_bar.stop()
+            progress_bar.config(mode="determinate", maximum=max(total, 1), value=done)
+            status_label.config(text=f"Comparing files... {done}/{total}")
+        elif update[0] == "timing":
+            stage_timings.append(f"{update[1]}: {update[2]:.1f} s")
+            timings_label.config(text="   ".join(stage_timings))
+        elif update[0] == "done":
+            finish_background_task()
+            messagebox.showinfo("Execution Result", update[1])
+        elif update[0] == "error":
+            finish_background_task()
+            messagebox.showerror("Execution Error", update[1])
+    root.after(100, poll_progress_queue)
+
+def execute_script():
+    folder_path = folder_path_entry.get()
+    files_to_check = parse_files_to_check(file_to_check_entry.get())
+    run_in_background(run_file_check, folder_path, files_to_check, compare_in_place.get())
+
+def execute_batch():
+    run_in_background(run_batch_check, folder_path_entry.get())
+
+def cancel_execution():
+    cancel_event.set()
+    status_label.config(text="Cancelling...")
+
+# Messages from the worker thread to the window, and the flag the Cancel button sets
+progress_queue = queue.Queue()
+cancel_event = threading.Event()
+stage_timings = []
+
+if __name__ == "__main__":
+    # Needed for the batch worker processes in the PyInstaller build
+    freeze_support()
+
+    # Create GUI window
+    root = Tk()
+    root.title("PDF Duplicate Checker")
+
+    Label(root, text="Folder Path:").grid(row=0, column=0, sticky="w")
+    Label(root, text="Select the folder containing PDF files to check for duplicates.").grid(row=0, column=3, sticky="w")
+    Label(root, text="File to Check:").grid(row=1, column=0, sticky="w")
+    Label(root, text="Select the PDF files you want to check for duplicates (separate typed names with ;).").grid(row=1, column=3, sticky="w")
 
-# Create GUI window
-root = Tk()
-root.title("PDF Duplicate Checker")
+    folder_path_entry = Entry(root, width=50)
+    folder_path_entry.grid(row=0, column=1)
+    Button(root, text="Browse", command=browse_folder_path).grid(row=0, column=2)
 
-Label(root, text="Folder Path:").grid(row=0, column=0, sticky="w")
-Label(root, text="Select the folder containing PDF files to check for duplicates.").grid(row=0, column=3, sticky="w")
-Label(root, text="File to Check:").grid(row=1, column=0, sticky="w")
-Label(root, text="Select the PDF file you want to check for duplicates.").grid(row=1, column=3, sticky="w")
+    file_to_check_entry = Entry(root, width=50)
+    file_to_check_entry.grid(row=1, column=1)
+    Button(root, text="Browse", command=browse_file_to_check).grid(row=1, column=2)
 
-folder_path_entry = Entry(root, width=50)
-folder_path_entry.grid(row=0, column=1)
-Button(root, text="Browse", command=browse_folder_path).grid(row=0, column=2)
+    compare_in_place = BooleanVar(value=COMPARE_IN_PLACE)
+    Checkbutton(root, text="Compare in place (only link the duplicates into the check folder)", variable=compare_in_place).grid(row=2, column=1, sticky="w")
 
-file_to_check_entry = Entry(root, width=50)
-file_to_check_entry.grid(row=1, column=1)
-Button(root, text="Browse", command=browse_file_to_check).grid(row=1, column=2)
+    execute_button = Button(root, text="Execute", command=execute_script)
+    execute_button.grid(row=3, columnspan=3)
+    batch_button = Button(root, text="Check All Duplicated Names", command=execute_batch)
+    batch_button.grid(row=4, columnspan=3)
+    run_buttons = [execute_button, batch_button]
 
-Button(root, text="Execute", command=execute_script).grid(row=2, columnspan=3)
+    progress_bar = Progressbar(root, length=300)
+    progress_bar.grid(row=5, column=1, sticky="we")
+    cancel_button = Button(root, text="Cancel", command=cancel_execution, state="disabled")
+    cancel_button.grid(row=5, column=2)
+    status_label = Label(root, text="")
+    status_label.grid(row=6, column=1, sticky="w")
+    timings_label = Label(root, text="")
+    timings_label.grid(row=7, column=0, columnspan=4, sticky="w")
 
-root.mainloop()
+    root.after(100, poll_progress_queue)
+    root.mainloop()
 
 
 # if "." in file_to_check:
@@ -2,7 +2,13 @@
 # This script processes PDF and CAD files in a specified folder and its subfolders.
 
 # 1. **Finding Duplicate PDFs**:
-#    - The script generates MD5 hashes for each PDF file in the folder.
+#    - The script groups the PDFs by file size, then by a hash of their first and last few KB, and only
+#      generates a full hash for PDFs that still share both. Each PDF is fully hashed at most once.
+#    - The hash algorithm is set with HASH_ALGORITHM: "blake2b" (default), "md5", or "xxh3_128" if xxhash is installed.
+#      The duplicate groups are the same whichever algorithm is used.
+#    - Hashing runs on a pool of workers (HASH_POOL, HASH_WORKERS and HASH_BLOCK_SIZE at the top of the script).
+#    - Hashes are cached in "PDF Duplicate check cache.sqlite" in the same folder. On the next run, files whose
+#      path, size, modification time and inode are unchanged are not read again. Delete the file to start fresh.
 #    - It identifies and lists duplicate PDFs, grouping them together in columns in a CSV file.
 #    - The output CSV file is named "PDF Duplicate check.csv" and is saved in the same folder.
 #    - Each file is named in the format: `Pckg_{Package Number}_{Filename}`, where the package number is determined by the character 'A', 'B', 'C', or 'D' in a specific position in the folder name. For example, if the folder name contains `2024-07-15 s-104B-DES-OOOO-001-001`, the package number would be `2` (for 'B').
@@ -21,8 +27,13 @@
 # **Usage**:
 # 1. Ensure you have the required libraries installed:
 #    pip install pypdf tqdm
+#    pip install xxhash (optional, for the faster "xxh3_128" algorithm)
 
 # 2. Run the script and input the entire folder path to the parent folder when prompted (eg. C:\Users\Mohammed.Hashem\Desktop\Folder\)
+
+# 3. To compare the speed of the hash algorithms, run the script with --benchmark, optionally followed by a folder
+#    of sample PDFs (eg. python "PDF Duplicate Check (EG_60%).py" --benchmark C:\Users\...\Folder). Without a folder,
+#    random 2, 10 and 50 MB files are used.
 ###
 
 import os
@@ -30,8 +41,40 @@ import re
 from pathlib import Path
 import hashlib
 import csv
+import sqlite3
+import sys
+import tempfile
+import time
 from tqdm import tqdm
 from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Hash algorithms available for duplicate detection. xxh3_128 is not cryptographic, but is much faster and is only
+# used to tell files apart, not to secure them.
+HASH_ALGORITHMS = {
+    "blake2b": hashlib.blake2b,
+    "md5": hashlib.md5,
+}
+if xxhash is not None:
+    HASH_ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+HASH_ALGORITHM = "blake2b"
+
+# Bytes read from each end of a file for the quick pre-hash
+PARTIAL_HASH_SIZE = 8192
+
+# Hashing settings - use "thread" for network shares (I/O bound) and "process" for local SSD/NVMe drives (CPU bound)
+HASH_POOL = "thread"
+HASH_WORKERS = 8
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Hashes are cached next to the output CSV and reused on the next run for files that have not changed
+USE_HASH_CACHE = True
+HASH_CACHE_FILE_NAME = "PDF Duplicate check cache.sqlite"
 
 def find_files_by_extension(folder_path, extensions):
     """
@@ -49,53 +92,224 @@ def find_files_by_extension(folder_path, extensions):
         files.extend(Path(folder_path).glob(f'**/*{extension}'))
     return files
 
-def hash_file(file_path):
+def hash_file(file_path, block_size=HASH_BLOCK_SIZE, algorithm=HASH_ALGORITHM):
     """
-    Generate an MD5 hash for a file.
+    Generate a hash for a file.
 
     Args:
         file_path (str): The path to the file.
+        block_size (int): The number of bytes read per block.
+        algorithm (str): A key of HASH_ALGORITHMS.
 
     Returns:
-        str: The MD5 hash of the file.
+        str: The hash of the file.
     """
-    md5_hash = hashlib.md5()
+    file_hash = HASH_ALGORITHMS[algorithm]()
     with open(file_path, 'rb') as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            md5_hash.update(byte_block)
-    return md5_hash.hexdigest()
+        for byte_block in iter(lambda: f.read(block_size), b""):
+            file_hash.update(byte_block)
+    return file_hash.hexdigest()
 
-def find_duplicates(pdf_files):
+def hash_file_edges(file_path, edge_size=PARTIAL_HASH_SIZE, algorithm=HASH_ALGORITHM):
     """
-    Find duplicate PDF files by comparing their MD5 hash values.
+    Generate a hash of the first and last few KB of a file.
+
+    Files no larger than two edges are hashed in full, so for those the result
+    already identifies the whole content.
 
     Args:
-        pdf_files (list): A list of paths to PDF files.
+        file_path (str): The path to the file.
+        edge_size (int): The number of bytes to read from each end of the file.
+        algorithm (str): A key of HASH_ALGORITHMS.
 
     Returns:
-        list: A list of lists containing paths of duplicate PDF files.
+        str: The hash of the file edges.
+    """
+    file_hash = HASH_ALGORITHMS[algorithm]()
+    with open(file_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size <= 2 * edge_size:
+            file_hash.update(f.read())
+        else:
+            file_hash.update(f.read(edge_size))
+            f.seek(-edge_size, os.SEEK_END)
+            file_hash.update(f.read(edge_size))
+    return file_hash.hexdigest()
+
+class HashCache:
+    """
+    Persistent SQLite store of file hashes.
+
+    An entry is only reused while the file's path, size, modification time and
+    inode all still match, so edited or replaced files are hashed again.
+    """
+
+    def __init__(self, cache_path):
+        self.connection = sqlite3.connect(cache_path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT, kind TEXT, size INTEGER, mtime_ns INTEGER, inode INTEGER, digest TEXT, "
+            "PRIMARY KEY (path, kind))"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, file_path, file_stat, kind):
+        """
+        Return the cached hash of a file, or None if there is no valid entry.
+        """
+        row = self.connection.execute(
+            "SELECT digest FROM hashes WHERE path = ? AND kind = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+            (str(file_path), kind, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino),
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, file_path, file_stat, kind, digest):
+        """
+        Store the hash of a file, replacing any older entry for the same path.
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)",
+            (str(file_path), kind, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, digest),
+        )
+
+    def evict_missing(self, known_paths):
+        """
+        Delete the entries of files that no longer exist.
+
+        Args:
+            known_paths (iterable): Paths found by the current scan, which are kept without checking the disk.
+
+        Returns:
+            int: The number of files evicted.
+        """
+        known_paths = {str(file_path) for file_path in known_paths}
+        cached_paths = [row[0] for row in self.connection.execute("SELECT DISTINCT path FROM hashes")]
+        missing_paths = [(path,) for path in cached_paths if path not in known_paths and not os.path.exists(path)]
+        self.connection.executemany("DELETE FROM hashes WHERE path = ?", missing_paths)
+        return len(missing_paths)
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+def hash_files(file_paths, hash_function, desc, workers=HASH_WORKERS, pool=HASH_POOL, cache=None, file_stats=None,
+               algorithm=HASH_ALGORITHM, **kwargs):
+    """
+    Hash files concurrently with a thread or process pool.
+
+    Args:
+        file_paths (list): A list of paths to files.
+        hash_function (callable): A module-level function called as hash_function(path, algorithm=algorithm, **kwargs).
+        desc (str): The label for the progress bar.
+        workers (int): The number of concurrent workers. 1 hashes the files serially.
+        pool (str): "thread" or "process".
+        cache (HashCache): Optional cache consulted before hashing and updated afterwards.
+        file_stats (dict): A mapping of each path to its os.stat result, required with a cache.
+        algorithm (str): A key of HASH_ALGORITHMS.
+
+    Returns:
+        dict: A mapping of each path to its hash.
+    """
+    kwargs["algorithm"] = algorithm
+    hashes = {}
+    if cache is not None:
+        kind = f"{hash_function.__name__}:{algorithm}"
+        for file_path in file_paths:
+            digest = cache.get(file_path, file_stats[file_path], kind)
+            if digest is not None:
+                hashes[file_path] = digest
+        file_paths = [file_path for file_path in file_paths if file_path not in hashes]
+
+    if workers <= 1 or len(file_paths) <= 1:
+        new_hashes = {file_path: hash_function(file_path, **kwargs) for file_path in tqdm(file_paths, desc=desc)}
+    else:
+        if pool == "thread":
+            executor_class = ThreadPoolExecutor
+        elif pool == "process":
+            executor_class = ProcessPoolExecutor
+        else:
+            raise ValueError(f"Unknown hashing pool '{pool}', expected 'thread' or 'process'.")
+
+        new_hashes = {}
+        with executor_class(max_workers=workers) as executor:
+            futures = {executor.submit(hash_function, file_path, **kwargs): file_path for file_path in file_paths}
+            # Update the progress bar as each worker finishes, whatever the submission order
+            for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+                new_hashes[futures[future]] = future.result()
+
+    if cache is not None:
+        for file_path, digest in new_hashes.items():
+            cache.put(file_path, file_stats[file_path], kind, digest)
+    hashes.update(new_hashes)
+    return hashes
+
+def group_files(file_paths, file_keys):
     """
-    checked_files = set()
-    duplicates = []
+    Group files by a precomputed key and keep only the groups with more than one file.
 
-    for i, current_pdf in enumerate(tqdm(pdf_files, desc="Checking for duplicates")):
-        if current_pdf in checked_files:
-            continue
+    Args:
+        file_paths (list): A list of paths to files.
+        file_keys (dict): A mapping of each path to its grouping key.
 
-        current_hash = hash_file(current_pdf)
-        current_duplicates = [current_pdf]
+    Returns:
+        list: A list of lists of paths sharing the same key, in input order.
+    """
+    groups = {}
+    for file_path in file_paths:
+        groups.setdefault(file_keys[file_path], []).append(file_path)
+    return [group for group in groups.values() if len(group) > 1]
 
-        for other_pdf in pdf_files[i+1:]:
-            if other_pdf not in checked_files:
-                other_hash = hash_file(other_pdf)
-                if current_hash == other_hash:
-                    current_duplicates.append(other_pdf)
-                    checked_files.add(other_pdf)
+def find_duplicates(pdf_files, workers=HASH_WORKERS, pool=HASH_POOL, block_size=HASH_BLOCK_SIZE, cache=None,
+                    algorithm=HASH_ALGORITHM):
+    """
+    Find duplicate PDF files by comparing their hash values.
 
-        if len(current_duplicates) > 1:
-            duplicates.append(current_duplicates)
-            checked_files.update(current_duplicates)
+    Files are first bucketed by size, then by a hash of their first and last
+    few KB, and only files that still collide are hashed in full. Every file is
+    fully hashed at most once and files with a unique size are never read.
 
+    Args:
+        pdf_files (list): A list of paths to PDF files.
+        workers (int): The number of concurrent hashing workers.
+        pool (str): "thread" or "process", see hash_files.
+        block_size (int): The number of bytes read per block when fully hashing a file.
+        cache (HashCache): Optional persistent cache of hashes from earlier runs.
+        algorithm (str): A key of HASH_ALGORITHMS.
+
+    Returns:
+        list: A list of lists containing paths of duplicate PDF files.
+    """
+    # Drop repeated paths, keeping the first occurrence
+    pdf_files = list(dict.fromkeys(pdf_files))
+    order = {pdf: i for i, pdf in enumerate(pdf_files)}
+
+    file_stats = {pdf: pdf.stat() for pdf in tqdm(pdf_files, desc="Reading file sizes")}
+    file_sizes = {pdf: file_stat.st_size for pdf, file_stat in file_stats.items()}
+    size_groups = group_files(pdf_files, file_sizes)
+
+    candidates = [pdf for group in size_groups for pdf in group]
+    edge_hashes = hash_files(candidates, hash_file_edges, "Hashing file edges", workers, pool, cache, file_stats, algorithm)
+    edge_groups = [edge_group for group in size_groups for edge_group in group_files(group, edge_hashes)]
+
+    # The edge hash already covers the whole of small files, so only larger ones need a full hash
+    duplicates = [group for group in edge_groups if file_sizes[group[0]] <= 2 * PARTIAL_HASH_SIZE]
+    edge_groups = [group for group in edge_groups if file_sizes[group[0]] > 2 * PARTIAL_HASH_SIZE]
+
+    candidates = [pdf for group in edge_groups for pdf in group]
+    full_hashes = hash_files(candidates, hash_file, "Checking for duplicates", workers, pool, cache, file_stats, algorithm,
+                             block_size=block_size)
+    for group in edge_groups:
+        duplicates.extend(group_files(group, full_hashes))
+
+    # Keep the order of the original pairwise scan: groups by their first file, files in input order
+    for duplicate_set in duplicates:
+        duplicate_set.sort(key=order.get)
+    duplicates.sort(key=lambda duplicate_set: order[duplicate_set[0]])
     return duplicates
 
 def write_csv(data, output_path, headers=None):
@@ -151,12 +365,17 @@ def find_mismatched_files(pdf_files, cad_files):
 
     return pdf_no_cad, cad_no_pdf, matching_files
 
-def main(folder_path):
+def main(folder_path, workers=HASH_WORKERS, pool=HASH_POOL, block_size=HASH_BLOCK_SIZE, algorithm=HASH_ALGORITHM):
     pdf_files = find_files_by_extension(folder_path, ('.pdf',))
     cad_files = find_files_by_extension(folder_path, ('.dwg', '.dxf', '.dgn'))  # Assuming CAD files have these extensions
 
     # Show a progress bar for PDF comparison
-    duplicates = find_duplicates(pdf_files)
+    if USE_HASH_CACHE:
+        with HashCache(Path(folder_path) / HASH_CACHE_FILE_NAME) as cache:
+            duplicates = find_duplicates(pdf_files, workers, pool, block_size, cache, algorithm)
+            cache.evict_missing(pdf_files)
+    else:
+        duplicates = find_duplicates(pdf_files, workers, pool, block_size, algorithm=algorithm)
         
     if duplicates:
         output_path = Path(folder_path) / "PDF Duplicate check.csv"
@@ -198,6 +417,50 @@ def main(folder_path):
     else:
         print("No CAD/PDF mismatches or matches found, no output file created.")
 
+def benchmark_hash_algorithms(folder_path=None, sizes_mb=(2, 10, 50), block_size=HASH_BLOCK_SIZE):
+    """
+    Print the hashing speed of every algorithm in HASH_ALGORITHMS in MB/s.
+
+    Each file is read once before timing so that all algorithms hash from the OS file cache.
+    When a folder is given, also checks that every algorithm finds the same duplicate groups.
+
+    Args:
+        folder_path (str): Optional folder of sample PDFs. Random files of sizes_mb are used otherwise.
+        sizes_mb (tuple): The sizes of the random sample files in MB.
+        block_size (int): The number of bytes read per block.
+    """
+    with tempfile.TemporaryDirectory() as temp_folder:
+        if folder_path:
+            sample_files = find_files_by_extension(folder_path, ('.pdf',))
+        else:
+            sample_files = []
+            for size_mb in sizes_mb:
+                sample_file = Path(temp_folder) / f"sample_{size_mb}MB.pdf"
+                sample_file.write_bytes(os.urandom(size_mb * 1024 * 1024))
+                sample_files.append(sample_file)
+
+        total_mb = sum(sample_file.stat().st_size for sample_file in sample_files) / (1024 * 1024)
+        for sample_file in sample_files:
+            sample_file.read_bytes()
+
+        print(f"Hashing {len(sample_files)} files ({total_mb:.1f} MB) with a block size of {block_size} bytes")
+        for algorithm in HASH_ALGORITHMS:
+            start = time.perf_counter()
+            for sample_file in sample_files:
+                hash_file(sample_file, block_size, algorithm)
+            elapsed = time.perf_counter() - start
+            print(f"{algorithm:>10}: {total_mb / elapsed:8.1f} MB/s")
+
+    if folder_path:
+        groups = {algorithm: find_duplicates(sample_files, workers=1, algorithm=algorithm) for algorithm in HASH_ALGORITHMS}
+        if all(duplicates == groups[HASH_ALGORITHM] for duplicates in groups.values()):
+            print("All algorithms found the same duplicate groups.")
+        else:
+            print("WARNING: the algorithms found different duplicate groups.")
+
 if __name__ == "__main__":
-    folder_path = input("Enter the folder path containing PDF and CAD files: ")
-    main(folder_path)
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark_hash_algorithms(sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        folder_path = input("Enter the folder path containing PDF and CAD files: ")
+        main(folder_path)
@@ -4,14 +4,62 @@
     # a single PDF with a name in the format: Pckg1/2/3/4_60%_{XXX}_combined.pdf. The package number is determined
     # by the presence of 'A', 'B', 'C', or 'D' in a specific location of the folder name (e.g., 2024-07-15 s-104*D*-DES-OOOO-001-001 -A).
     
+    # With INCREMENTAL_MERGE = True, the input files and merge options of every combined PDF are recorded in
+    # "merge manifest.json" in the folder, and on the next run only the combined PDFs whose input files or options
+    # changed are rebuilt. Set it to False (or delete the manifest) to delete and rebuild every combined PDF.
+    # With OPTIMISE_OUTPUT = True, each combined PDF is rewritten with compressed content streams and packed object
+    # streams, and also linearized ("fast web view") with LINEARIZE_OUTPUT = True, so the first page opens quickly over
+    # SharePoint/VPN. This needs pikepdf (pip install pikepdf); without it only the content streams are compressed.
+    # Groups are merged in parallel, on IN_MEMORY_MERGE_WORKERS processes (each holds a whole group in memory), or on
+    # MERGE_WORKERS processes with STREAMING_MERGE = True. Set them to 1 to merge one group at a time.
+    # With STREAMING_MERGE = True, each combined PDF is written to disk one sheet at a time, so memory use stays at
+    # about one sheet no matter how many sheets are in the group (bookmarks and form fields are not carried over).
+    # With DEDUPLICATE_RESOURCES = True as well, fonts, logos and other objects that are identical across sheets are
+    # written once per combined PDF, and the space saved is reported at the end.
+
 #New users use pip install pypdf
 #Run the code and input file path to target folder when prompted
+#To compare the peak memory of the two merge modes, run the code with --benchmark, optionally followed by a folder
+#(eg. python "PDF Merger (EG).py" --benchmark C:\Users\...\Folder). Without a folder, synthetic sheets are used.
 
+import hashlib
+import io
+import json
 import os
 import re
-from pypdf import PdfWriter
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Process, Queue
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject, StreamObject
 from tqdm import tqdm
 
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
+
+# Write combined PDFs sheet by sheet instead of building the whole group in memory first
+STREAMING_MERGE = False
+
+# When streaming, write identical objects (fonts, logos, title blocks...) only once per combined PDF
+DEDUPLICATE_RESOURCES = True
+
+# Only rebuild the combined PDFs whose input files changed since the last run
+INCREMENTAL_MERGE = True
+MANIFEST_FILE_NAME = "merge manifest.json"
+
+# Compress and optionally linearize each combined PDF after it is written
+OPTIMISE_OUTPUT = False
+LINEARIZE_OUTPUT = False
+
+# Number of groups merged at the same time, each in its own process. Without streaming every process holds
+# a whole group in memory, so fewer groups are merged at once
+MERGE_WORKERS = os.cpu_count() or 1
+IN_MEMORY_MERGE_WORKERS = min(2, MERGE_WORKERS)
+
 def get_package_number(folder_name):
     """
     Determines the package number based on the character 'A', 'B', 'C', or 'D'
@@ -31,12 +79,12 @@ def get_package_number(folder_name):
             return 4
     raise ValueError("Folder name does not contain A/B/C/D at the specified location.")
 
-def delete_existing_merged_files(folder_path):
+def delete_existing_merged_files(folder_path, keep=()):
     """
-    Deletes existing merged PDF files in the specified folder.
+    Deletes existing merged PDF files in the specified folder, except the file names in keep.
     """
     for file_name in os.listdir(folder_path):
-        if "combined" in file_name.lower() and file_name.endswith(".pdf"):
+        if "combined" in file_name.lower() and file_name.endswith(".pdf") and file_name not in keep:
             try:
                 os.remove(os.path.join(folder_path, file_name))
                 print(f"Deleted existing file: {file_name}")
@@ -55,10 +103,308 @@ def sort_files(file_list):
 
     return sorted(file_list, key=sort_key)
 
-def merge_pdfs_by_xxx(file_list, package_number, output_dir):
+class StreamingPdfWriter:
+    """
+    Writes a PDF made of the pages of other PDFs, sending each page and the objects it uses
+    straight to the output file.
+
+    Only the objects of the sheet being copied are held in memory, plus the file offset of every
+    object written so far (needed for the cross-reference table at the end). Pages that share
+    objects within one source file, such as a title block used on every page, share them in the output too.
+
+    With deduplicate=True, objects are written children first and identified by the hash of their
+    content, so an object that is identical to one already written (a font embedded in every sheet,
+    for example) is referenced instead of written again. bytes_saved counts the bytes not written.
+    """
+
+    def __init__(self, output_file, deduplicate=False):
+        self.output_file = output_file
+        self.deduplicate = deduplicate
+        self.offsets = [0]  # Object 0 is the head of the free list
+        self.page_ids = []
+        self.object_ids = {}  # Content hash -> object number, used when deduplicating
+        self.in_progress = set()
+        self.bytes_saved = 0
+        self.output_file.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self.pages_id = self._reserve_id()
+
+    def _reserve_id(self):
+        self.offsets.append(None)
+        return len(self.offsets) - 1
+
+    def _write_object(self, object_id, pdf_object):
+        self._write_serialized(object_id, self._serialize(pdf_object))
+
+    def _serialize(self, pdf_object):
+        buffer = io.BytesIO()
+        pdf_object.write_to_stream(buffer)
+        return buffer.getvalue()
+
+    def _write_serialized(self, object_id, data):
+        self.offsets[object_id] = self.output_file.tell()
+        self.output_file.write(f"{object_id} 0 obj\n".encode())
+        self.output_file.write(data)
+        self.output_file.write(b"\nendobj\n")
+
+    def _write_deduplicated(self, reference, key, id_map, pending):
+        """
+        Write an indirect object after its children, or reuse an identical object already written.
+        Returns the object's number in the output file.
+        """
+        self.in_progress.add(key)
+        data = self._serialize(self._copy(reference.get_object(), id_map, pending))
+        self.in_progress.discard(key)
+        if key in id_map:
+            # One of its children refers back to it, so it was given a number while being copied
+            self._write_serialized(id_map[key], data)
+            return id_map[key]
+
+        digest = hashlib.blake2b(data).digest()
+        if digest in self.object_ids:
+            self.bytes_saved += len(data)
+            return self.object_ids[digest]
+        object_id = self._reserve_id()
+        self._write_serialized(object_id, data)
+        self.object_ids[digest] = object_id
+        return object_id
+
+    def _copy(self, pdf_object, id_map, pending):
+        """
+        Copy a direct object, giving every indirect object it refers to a number in the output file.
+        Objects seen for the first time are added to pending so they are written next, or written
+        straight away when deduplicating.
+        """
+        if isinstance(pdf_object, IndirectObject):
+            key = (pdf_object.idnum, pdf_object.generation)
+            if key not in id_map:
+                if key in self.in_progress:
+                    # A reference back to an object still being copied: number it now, it is written once copied
+                    id_map[key] = self._reserve_id()
+                elif self.deduplicate:
+                    id_map[key] = self._write_deduplicated(pdf_object, key, id_map, pending)
+                else:
+                    id_map[key] = self._reserve_id()
+                    pending.append((id_map[key], pdf_object))
+            return IndirectObject(id_map[key], 0, None)
+        if isinstance(pdf_object, StreamObject):
+            copied = pdf_object.__class__()
+            copied._data = pdf_object._data
+            copied.update({key: self._copy(value, id_map, pending) for key, value in pdf_object.items()})
+            return copied
+        if isinstance(pdf_object, DictionaryObject):
+            return DictionaryObject({key: self._copy(value, id_map, pending) for key, value in pdf_object.items()})
+        if isinstance(pdf_object, ArrayObject):
+            return ArrayObject(self._copy(value, id_map, pending) for value in pdf_object)
+        return pdf_object
+
+    def append(self, pdf_path):
+        """
+        Add every page of a PDF file to the end of the output.
+        """
+        reader = PdfReader(pdf_path)
+        id_map = {}
+        page_ids = []
+        # Number the pages first so links between pages of the same file point at the copies
+        for page in reader.pages:
+            page_ids.append(self._reserve_id())
+            if page.indirect_reference is not None:
+                id_map[(page.indirect_reference.idnum, page.indirect_reference.generation)] = page_ids[-1]
+
+        for page, page_id in zip(reader.pages, page_ids):
+            pending = []
+            page_copy = self._copy(DictionaryObject({key: value for key, value in page.items() if key != "/Parent"}), id_map, pending)
+            page_copy[NameObject("/Parent")] = IndirectObject(self.pages_id, 0, None)
+            self._write_object(page_id, page_copy)
+            while pending:
+                object_id, reference = pending.pop()
+                self._write_object(object_id, self._copy(reference.get_object(), id_map, pending))
+            self.page_ids.append(page_id)
+
+    def close(self):
+        """
+        Write the page tree, catalog and cross-reference table. The output file is left open.
+        """
+        pages = DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(IndirectObject(page_id, 0, None) for page_id in self.page_ids),
+            NameObject("/Count"): NumberObject(len(self.page_ids)),
+        })
+        self._write_object(self.pages_id, pages)
+        catalog_id = self._reserve_id()
+        catalog = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(self.pages_id, 0, None),
+        })
+        self._write_object(catalog_id, catalog)
+
+        xref_offset = self.output_file.tell()
+        self.output_file.write(f"xref\n0 {len(self.offsets)}\n0000000000 65535 f \n".encode())
+        for offset in self.offsets[1:]:
+            self.output_file.write(f"{offset:010d} 00000 n \n".encode())
+        self.output_file.write(
+            f"trailer\n<< /Size {len(self.offsets)} /Root {catalog_id} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+
+def merge_group(file_paths, output_path, streaming=STREAMING_MERGE, deduplicate=DEDUPLICATE_RESOURCES):
+    """
+    Merges the given PDF files, in order, into one PDF at output_path.
+    Returns the number of bytes saved by writing identical objects once (streaming with deduplicate only).
+    """
+    if streaming:
+        with open(output_path, "wb") as output_pdf:
+            writer = StreamingPdfWriter(output_pdf, deduplicate)
+            for file_path in file_paths:
+                writer.append(file_path)
+            writer.close()
+        return writer.bytes_saved
+    else:
+        writer = PdfWriter()
+        for file_path in file_paths:
+            writer.append(file_path)
+
+        # Write the merged PDF
+        with open(output_path, "wb") as output_pdf:
+            writer.write(output_pdf)
+        return 0
+
+def optimise_pdf(pdf_path, linearize=LINEARIZE_OUTPUT):
+    """
+    Rewrites a PDF with compressed content streams, objects packed into object streams and,
+    if linearize is True, linearized for fast web view. Without pikepdf, only the content
+    streams are compressed, and the original is kept if that does not make it smaller.
+    Returns (size before, size after, seconds taken).
+    """
+    start = time.perf_counter()
+    size_before = os.path.getsize(pdf_path)
+    if pikepdf is not None:
+        with pikepdf.open(pdf_path, allow_overwriting_input=True) as pdf:
+            pdf.save(
+                pdf_path,
+                compress_streams=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                linearize=linearize,
+            )
+    else:
+        writer = PdfWriter(clone_from=pdf_path)
+        for page in writer.pages:
+            page.compress_content_streams()
+        optimised_path = pdf_path + ".optimised"
+        with open(optimised_path, "wb") as output_pdf:
+            writer.write(output_pdf)
+        # Content streams that were already compressed can come out larger, keep the original then
+        if os.path.getsize(optimised_path) < size_before:
+            os.replace(optimised_path, pdf_path)
+        else:
+            os.remove(optimised_path)
+    return size_before, os.path.getsize(pdf_path), time.perf_counter() - start
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """
+    Returns the BLAKE2b hash of a file.
+    """
+    file_hash = hashlib.blake2b()
+    with open(file_path, 'rb') as f:
+        for byte_block in iter(lambda: f.read(block_size), b""):
+            file_hash.update(byte_block)
+    return file_hash.hexdigest()
+
+def describe_merge_options(streaming, deduplicate, optimise, linearize):
+    """
+    Returns the merge options that change a combined PDF, as recorded in the manifest. Options that
+    have no effect (deduplicate without streaming, linearize without optimise or pikepdf) are recorded as False.
+    """
+    return {
+        "streaming": bool(streaming),
+        "deduplicate": bool(streaming and deduplicate),
+        "optimise": bool(optimise),
+        "linearize": bool(optimise and linearize and pikepdf is not None),
+    }
+
+def describe_input_files(file_paths):
+    """
+    Returns the name, size, modification time and hash of each input file, as recorded in the manifest.
+    """
+    records = []
+    for file_path in file_paths:
+        file_stat = os.stat(file_path)
+        records.append({
+            "name": os.path.basename(file_path),
+            "size": file_stat.st_size,
+            "mtime_ns": file_stat.st_mtime_ns,
+            "digest": hash_file(file_path),
+        })
+    return records
+
+def build_group(file_paths, output_path, streaming=STREAMING_MERGE, deduplicate=DEDUPLICATE_RESOURCES,
+                optimise=OPTIMISE_OUTPUT, linearize=LINEARIZE_OUTPUT):
+    """
+    Merges a group with merge_group, then optimises it with optimise_pdf if optimise is True.
+    Returns the manifest records of its input files (taken before merging so a file changed during
+    the merge is picked up on the next run), the bytes saved by deduplication, and the
+    optimise_pdf result or None.
+    """
+    records = describe_input_files(file_paths)
+    bytes_saved = merge_group(file_paths, output_path, streaming, deduplicate)
+    optimisation = optimise_pdf(output_path, linearize) if optimise else None
+    return records, bytes_saved, optimisation
+
+def load_manifest(manifest_path):
+    """
+    Returns the saved manifest, a dict of combined file name to its merge options ("options") and the records
+    of its input files ("inputs"), or {} if there is none.
+    """
+    try:
+        with open(manifest_path, 'r') as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest, manifest_path):
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+
+def is_group_unchanged(file_paths, output_path, entry, options):
+    """
+    Checks whether a combined PDF is still up to date with its input files and merge options.
+
+    The combined PDF is rebuilt if it was made with other options (see describe_merge_options), or by a
+    version of this script that did not record them. An input whose size and modification time match its
+    record is taken as unchanged. If only the modification time differs, the file is hashed and compared
+    with the recorded hash, and the record is updated when the content is the same.
+    """
+    if not isinstance(entry, dict) or entry.get("options") != options or not os.path.exists(output_path):
+        return False
+    records = entry.get("inputs")
+    if not records:
+        return False
+    if [os.path.basename(file_path) for file_path in file_paths] != [record["name"] for record in records]:
+        return False
+    for file_path, record in zip(file_paths, records):
+        file_stat = os.stat(file_path)
+        if file_stat.st_size != record["size"]:
+            return False
+        if file_stat.st_mtime_ns != record["mtime_ns"]:
+            if hash_file(file_path) != record["digest"]:
+                return False
+            record["mtime_ns"] = file_stat.st_mtime_ns
+    return True
+
+def merge_pdfs_by_xxx(file_list, package_number, output_dir, streaming=STREAMING_MERGE, workers=None,
+                      incremental=INCREMENTAL_MERGE, deduplicate=DEDUPLICATE_RESOURCES, optimise=OPTIMISE_OUTPUT,
+                      linearize=LINEARIZE_OUTPUT):
     """
     Merges PDFs with the same XXX into a single PDF and saves it with the specified naming format.
+    With streaming=True, each merged PDF is written with StreamingPdfWriter instead of being built in memory,
+    and with deduplicate=True as well, identical objects are written once per merged PDF.
+    With optimise=True, each merged PDF is compressed (and linearized if linearize=True) with optimise_pdf.
+    With workers > 1, the groups are merged in parallel, each keeping the order of file_list. By default
+    workers is MERGE_WORKERS when streaming and IN_MEMORY_MERGE_WORKERS otherwise.
+    With incremental=True, combined PDFs whose input files and options are unchanged since the last run (according
+    to the manifest) are kept, other combined PDFs in output_dir are deleted, and only the rest are rebuilt.
     """
+    if workers is None:
+        workers = MERGE_WORKERS if streaming else IN_MEMORY_MERGE_WORKERS
+
     merged_files = {}
     for file in file_list:
         parts = file.split('-')
@@ -70,22 +416,71 @@ def merge_pdfs_by_xxx(file_list, package_number, output_dir):
             merged_files[xxx] = []
         merged_files[xxx].append(file)
 
-    # Initialize tqdm progress bar
-    progress = tqdm(total=len(merged_files.items()), desc='Merging PDFs', unit='file')
-
+    groups = []
     for xxx, files in merged_files.items():
-        writer = PdfWriter()
-        for file in files:
-            writer.append(os.path.join(output_dir, file))
         output_filename = f"Pckg{package_number}_60%_{xxx}_combined.pdf"
         output_path = os.path.join(output_dir, output_filename)
+        groups.append(([os.path.join(output_dir, file) for file in files], output_path))
 
-        # Write the merged PDF
-        with open(output_path, "wb") as output_pdf:
-            writer.write(output_pdf)
-        progress.update(1)  # Update progress bar
+    options = describe_merge_options(streaming, deduplicate, optimise, linearize)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    manifest = {}
+    if incremental:
+        old_manifest = load_manifest(manifest_path)
+        output_names = {os.path.basename(output_path) for file_paths, output_path in groups}
+        delete_existing_merged_files(output_dir, keep=output_names)
+        dirty_groups = []
+        for file_paths, output_path in groups:
+            output_name = os.path.basename(output_path)
+            if is_group_unchanged(file_paths, output_path, old_manifest.get(output_name), options):
+                manifest[output_name] = old_manifest[output_name]
+            else:
+                dirty_groups.append((file_paths, output_path))
+        print(f"{len(groups) - len(dirty_groups)} combined PDFs are up to date, {len(dirty_groups)} to rebuild")
+        groups = dirty_groups
+
+    # Initialize tqdm progress bar
+    progress = tqdm(total=len(groups), desc='Merging PDFs', unit='file')
+
+    if optimise and linearize and pikepdf is None:
+        print("pikepdf is not installed (pip install pikepdf): combined PDFs will be compressed but not linearized")
+
+    total_bytes_saved = 0
+    optimisations = {}
+    if workers <= 1 or len(groups) <= 1:
+        for file_paths, output_path in groups:
+            records, bytes_saved, optimisation = build_group(
+                file_paths, output_path, streaming, deduplicate, optimise, linearize
+            )
+            manifest[os.path.basename(output_path)] = {"options": options, "inputs": records}
+            total_bytes_saved += bytes_saved
+            optimisations[os.path.basename(output_path)] = optimisation
+            progress.update(1)  # Update progress bar
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(build_group, file_paths, output_path, streaming, deduplicate, optimise, linearize): output_path
+                for file_paths, output_path in groups
+            }
+            for future in as_completed(futures):
+                records, bytes_saved, optimisation = future.result()
+                manifest[os.path.basename(futures[future])] = {"options": options, "inputs": records}
+                total_bytes_saved += bytes_saved
+                optimisations[os.path.basename(futures[future])] = optimisation
+                progress.update(1)  # Update progress bar as each worker finishes a group
     progress.close()
 
+    if optimise:
+        for output_name, (size_before, size_after, seconds) in sorted(optimisations.items()):
+            print(f"Optimised {output_name}: {size_before / (1024 * 1024):.1f} MB -> "
+                  f"{size_after / (1024 * 1024):.1f} MB in {seconds:.1f} s")
+
+    if streaming and deduplicate:
+        print(f"Shared resources written once: {total_bytes_saved / (1024 * 1024):.1f} MB saved")
+
+    if incremental:
+        save_manifest(manifest, manifest_path)
+
 def main():
     
   
@@ -96,9 +491,10 @@ def main():
         print(f"The path {folder_path} is not a valid directory.")
         return
 
-    # Delete existing merged files before starting any operations
-    print("Deleting existing merged PDF files...")
-    delete_existing_merged_files(folder_path)
+    # Delete existing merged files before starting any operations, unless only the changed ones are rebuilt
+    if not INCREMENTAL_MERGE:
+        print("Deleting existing merged PDF files...")
+        delete_existing_merged_files(folder_path)
 
     folder_name = os.path.basename(folder_path)
     try:
@@ -123,5 +519,86 @@ def main():
 
     merge_pdfs_by_xxx(sorted_files, package_number, folder_path)
 
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of the current process in MB, or None if it cannot be measured.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil  # Windows: pip install psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+def run_merge_for_benchmark(file_paths, output_path, streaming, results):
+    """
+    Merges the files in a fresh process and reports (seconds, peak RSS in MB) back through results.
+    """
+    start = time.perf_counter()
+    merge_group(file_paths, output_path, streaming)
+    results.put((time.perf_counter() - start, peak_rss_mb()))
+
+def create_benchmark_sheets(folder_path, sheet_count=300, sheet_size_mb=1):
+    """
+    Creates synthetic drawing sheets, each carrying an incompressible image of sheet_size_mb.
+    """
+    file_list = []
+    for i in range(sheet_count):
+        writer = PdfWriter()
+        page = writer.add_blank_page(2384, 1684)  # A1 landscape
+        image = StreamObject()
+        image._data = os.urandom(sheet_size_mb * 1024 * 1024)
+        image.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(1024),
+            NameObject("/Height"): NumberObject(sheet_size_mb * 1024),
+            NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+        })
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): writer._add_object(image)})
+        })
+        file_path = os.path.join(folder_path, f"282442-ADC-DES0-BEN-DWG-CIV1-{i:05d}.pdf")
+        with open(file_path, "wb") as sheet:
+            writer.write(sheet)
+        file_list.append(file_path)
+    return file_list
+
+def benchmark_merge_memory(folder_path=None):
+    """
+    Merges the same files with and without streaming, each in its own process, and prints
+    the time taken and the peak RSS of each. The combined files are written to a temporary folder.
+    """
+    with tempfile.TemporaryDirectory() as temp_folder:
+        if folder_path:
+            pattern = re.compile(r'282442-ADC-DES0-[A-Z0-9]{3}-DWG-[A-Z0-9]{4}-\d{5}\.pdf', re.IGNORECASE)
+            file_list = sort_files([f for f in os.listdir(folder_path) if pattern.match(f)])
+            file_list = [os.path.join(folder_path, f) for f in file_list]
+        else:
+            print("Creating synthetic sheets...")
+            file_list = create_benchmark_sheets(temp_folder)
+        print(f"Merging {len(file_list)} sheets into one PDF")
+
+        for streaming in (False, True):
+            results = Queue()
+            output_path = os.path.join(temp_folder, "benchmark_combined.pdf")
+            process = Process(target=run_merge_for_benchmark, args=(file_list, output_path, streaming, results))
+            process.start()
+            seconds, peak_mb = results.get()
+            process.join()
+            mode = "streaming" if streaming else "in memory"
+            peak = f"{peak_mb:.0f} MB" if peak_mb is not None else "n/a (pip install psutil)"
+            print(f"{mode:>10}: {seconds:6.1f} s, peak RSS {peak}")
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark_merge_memory(sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        main()
@@ -1,51 +1,489 @@
 ####
 #UPDATE PATH BELOW TO WORKING LOCATION !!
 #CREATE _Others AND ALL OTHER STRUCTURE FILES FIRST
+#Every run first writes the planned moves to "PDF Sorter plan.csv" in the folder; set DRY_RUN = True to stop there and review it
+#Moves that were made are added to "PDF Sorter moves.csv"; "python "PDF Sorter (ONCorr).py" --rollback" moves them back
+#(newest first, across all runs) and leaves only the moves that could not be undone in the log
+#On network shares, set MOVE_WORKERS to ~8 so several moves are in flight at once
+#"python "PDF Sorter (ONCorr).py" --benchmark" times the single-pass classifier against the old substring loops on 100k names
+#"python "PDF Sorter (ONCorr).py" --watch" keeps running and sorts each file as it lands (once it has stopped changing for
+#SETTLE_SECONDS). It is notified instantly with pip install watchdog (inotify on Linux), otherwise it polls every WATCH_POLL_SECONDS
+#A file whose name already exists in its destination folder is reported once and left in place until it changes
 ####
 
+import csv
 import os
+import queue
+import random
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    from watchdog.observers import Observer #pip install watchdog (optional, --watch polls the folder without it)
+except ImportError:
+    Observer = None
 
 path = r"C:\Users\Mohammed.Hashem\OneDrive - Arup\Projects\07 - On-Corr\11 - LSW Submission Review\06-Corridor Submissions\LSW Cordr Pck A 240624"
 
+DRY_RUN = False
+PLAN_FILE_NAME = "PDF Sorter plan.csv"
+MOVES_FILE_NAME = "PDF Sorter moves.csv"
+MOVE_WORKERS = 1
+ROLLBACK_ON_ERROR = True  # undo the whole run if any move fails
+SETTLE_SECONDS = 10  # --watch moves a file once its size and modified time have not changed for this long
+WATCH_POLL_SECONDS = 2
+
 type_filter = [".pdf", ".py", ".txt"]
-folders = []
 disciplines = ["CRD Highways", "CTR Traffic", "CWM Drainage", "STR Structural", "ENV Environmental", "LND Landscape", "PTY Property", "UTL Utilities", "MEC Mechanical", "ELE Electrical", "ART Architectural", "CCC Cable Containment", "CEG Civil Layout", "GBN Grounding", "PTY Property", "CIV Civil", "GEO Geotech"]
-for folder in os.listdir(path): #detects all the folders (not pdf, txt, etc)
-    if not any(folder.__contains__(x) for x in type_filter):
-        folders.append(folder) 
-        
 
 
+def is_structure_folder(name):
+    """
+    Returns True for entry names the sorter treats as structure folders rather than files to sort.
+    """
+    return not any(name.__contains__(x) for x in type_filter)
 
-all_files = [file for file in os.listdir(path)] #makes sure only desired file types are being looped through (pdf)
-files = set(all_files) - set(folders)
 
+def list_folders_and_files(path):
+    """
+    Splits the entries of path into structure folders (anything without .pdf, .py or .txt in its name)
+    and files to sort. The sorter's own plan and move logs are left out of both.
+    """
+    all_files = [file for file in os.listdir(path) if file not in (PLAN_FILE_NAME, MOVES_FILE_NAME)]
+    folders = [folder for folder in all_files if is_structure_folder(folder)] #detects all the folders (not pdf, txt, etc)
+    files = set(all_files) - set(folders) #makes sure only desired file types are being looped through (pdf)
+    return folders, files
 
-for file in files:#check every file
-    folder_count=0
-    src = os.path.join(path, file)
+
+def route_file(file, folders):
+    """
+    Returns the folder (relative to path) a file belongs in:
+    _Others if it names no structure or more than one, otherwise <structure>/<discipline>.
+    This is the original substring loop, kept as the reference for FileClassifier.
+    """
+    folder_count = 0
     file_folder = "_Others"
     for folder in folders: #checks if filename has any or multiple of the structures(folders) in submission
         if folder in file:
             file_folder = folder
-            folder_count = folder_count +1
+            folder_count = folder_count + 1
 
     file_disp = "_Others"
     for displine in disciplines: ##checks if filename has any of the disciplines
         if displine[:3] in file:
             file_disp = displine
 
-    if folder_count>1:
-        dest = os.path.join(path, "_Others", file) #if this pdf is relevant to multiple structures, send to Others
+    if folder_count > 1 or file_folder == "_Others":
+        return "_Others" #relevant to multiple structures or to none, send to Others
+    return os.path.join(file_folder, file_disp) #relevant to a specific discipline in a specific structure
+
+
+def trie_regex(words):
+    """
+    Builds a regex matching any of words, nested by common prefix (e.g. "C(?:IV|RD|TR)") so the
+    regex engine branches on one character at a time, and preferring the longest word at a position.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}  # end of a word
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class FileClassifier:
+    """
+    Routes file names like route_file, but finds every structure name and discipline code
+    in one regex pass instead of one substring scan per structure and per discipline.
+
+    Args:
+        folders: Structure folder names, in the order route_file would check them.
+        disciplines: Discipline folder names; the first three characters are the code.
+    """
+
+    def __init__(self, folders, disciplines=disciplines):
+        self.folders = set(folders)
+        self.discipline_by_code = {}
+        for i, displine in enumerate(disciplines):
+            self.discipline_by_code[displine[:3]] = (i, displine)  # a repeated code (PTY) keeps its last entry, as the loop did
+        patterns = self.folders | set(self.discipline_by_code)
+        # The lookahead finds the longest pattern starting at each position; any shorter pattern that
+        # starts there too is inside it, so self.contained lists it
+        self.pattern = re.compile(f"(?=({trie_regex(patterns)}))") if patterns else None
+        self.contained = {p: [q for q in patterns if q in p] for p in patterns}
+        self.routes = {}
+
+    def longest_matches(self, file):
+        """
+        Returns the longest pattern starting at each position of file where one starts.
+        """
+        return frozenset(self.pattern.findall(file)) if self.pattern is not None else frozenset()
+
+    def find(self, file, matches=None):
+        """
+        Returns the set of structure names and discipline codes that occur in file.
+        """
+        found = set()
+        for match in self.longest_matches(file) if matches is None else matches:
+            found.update(self.contained[match])
+        return found
+
+    def route(self, file):
+        """
+        Returns the folder (relative to path) file belongs in, exactly as route_file(file, folders) would.
+        Files matching the same patterns share a route, so it is worked out once per combination.
+        """
+        matches = self.longest_matches(file)
+        route = self.routes.get(matches)
+        if route is None:
+            found = self.find(file, matches)
+            matched_folders = [folder for folder in found if folder in self.folders]
+            if len(matched_folders) != 1 or matched_folders[0] == "_Others":
+                route = "_Others"
+            else:
+                codes = [self.discipline_by_code[code] for code in found if code in self.discipline_by_code]
+                file_disp = max(codes)[1] if codes else "_Others"
+                route = os.path.join(matched_folders[0], file_disp)
+            self.routes[matches] = route
+        return route
+
+
+def plan_moves(path):
+    """
+    Works out every move without touching the files.
+
+    Returns:
+        A list of (source, destination) paths, sorted by file name, and the sorted list of
+        destination folders that do not exist yet (each listed once).
+    """
+    folders, files = list_folders_and_files(path)
+    classifier = FileClassifier(folders)
+    moves = []
+    new_folders = set()
+    for file in sorted(files):
+        dest_folder = os.path.join(path, classifier.route(file))
+        if dest_folder not in new_folders and not os.path.isdir(dest_folder):
+            new_folders.add(dest_folder)
+        moves.append((os.path.join(path, file), os.path.join(dest_folder, file)))
+    return moves, sorted(new_folders)
+
+
+def write_moves_csv(moves, csv_path, append=False):
+    """
+    Writes (source, destination) pairs to a CSV file, or adds them to the end of it if append is True.
+    """
+    new_file = not (append and os.path.exists(csv_path))
+    with open(csv_path, 'w' if new_file else 'a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        if new_file:
+            writer.writerow(["Source", "Destination"])
+        writer.writerows(moves)
+
+
+def read_moves_csv(csv_path):
+    """
+    Reads (source, destination) pairs written by write_moves_csv.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)
+        return [(src, dest) for src, dest in reader]
+
+
+def run_moves(moves, workers=MOVE_WORKERS):
+    """
+    Renames each source to its destination, on a thread pool when workers > 1.
+
+    Returns:
+        The moves that succeeded, in plan order, and a list of (move, error) for those that failed.
+    """
+    def move(src, dest):
+        os.rename(src, dest) #moves files
+
+    results = {}
+    if workers <= 1:
+        for src, dest in moves:
+            try:
+                move(src, dest)
+                results[(src, dest)] = None
+            except OSError as e:
+                results[(src, dest)] = e
     else:
-        if file_folder == "_Others":
-            dest = os.path.join(path, file_folder, file) #if file is not relevant to any specific submisison, send to others
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(move, src, dest): (src, dest) for src, dest in moves}
+            for future in as_completed(futures):
+                results[futures[future]] = future.exception()
+
+    done = [m for m in moves if m in results and results[m] is None]
+    failed = [(m, results[m]) for m in moves if results.get(m) is not None]
+    return done, failed
+
+
+def rollback_moves(moves, workers=MOVE_WORKERS):
+    """
+    Moves files back from their destination to their source, newest move first.
+
+    Returns:
+        The moves that were undone and the moves that could not be undone, both as
+        (source, destination) pairs in the order of moves.
+    """
+    done, failed = run_moves([(dest, src) for src, dest in reversed(moves)], workers)
+    for (src, dest), error in failed:
+        print(f"Could not move {src} back to {dest}: {error}")
+    print(f"Moved {len(done)} of {len(moves)} files back")
+    not_undone = {(src, dest) for (dest, src), error in failed}
+    return [m for m in moves if m not in not_undone], [m for m in moves if m in not_undone]
+
+
+def rollback_log(moves_log_path, workers=MOVE_WORKERS):
+    """
+    Undoes every move in the log written by apply_plan and --watch, then rewrites the log with only
+    the moves that could not be undone, so running it again does not retry the ones already undone.
+    """
+    undone, not_undone = rollback_moves(read_moves_csv(moves_log_path), workers)
+    write_moves_csv(not_undone, moves_log_path)
+    return undone, not_undone
+
+
+def apply_plan(moves, new_folders, moves_log_path, workers=MOVE_WORKERS, rollback_on_error=ROLLBACK_ON_ERROR):
+    """
+    Creates the new destination folders once, runs the moves and adds the ones made to the end of
+    moves_log_path, so the moves of earlier runs can still be undone.
+    If any move fails and rollback_on_error is True, the moves already made are undone
+    (any that cannot be undone are still logged).
+    """
+    for folder in new_folders: # creates discipline folders if not present
+        os.makedirs(folder, exist_ok=True)
+
+    done, failed = run_moves(moves, workers)
+    for (src, dest), error in failed:
+        print(f"Could not move {src} to {dest}: {error}")
+
+    if failed and rollback_on_error:
+        print(f"{len(failed)} moves failed, rolling back")
+        undone, done = rollback_moves(done, workers)
+    write_moves_csv(done, moves_log_path, append=True)
+    print(f"Moved {len(done)} of {len(moves)} files")
+    return done, failed
+
+
+class SubmissionWatcher:
+    """
+    Watches path and moves each new file to where plan_moves would, as soon as the file has finished
+    being written. The structure folders and their FileClassifier stay in memory between files and
+    are only rebuilt when a structure folder is added or removed. Files already in path are sorted too.
+    A file whose destination already exists is reported and left where it is until it changes again.
+
+    Args:
+        path: The submission folder to watch.
+        settle_seconds: How long a file's size and modified time must stay the same before it is moved.
+        poll_seconds: How often pending files are checked, and the folder is listed when watchdog is missing.
+    """
+
+    def __init__(self, path, settle_seconds=SETTLE_SECONDS, poll_seconds=WATCH_POLL_SECONDS):
+        self.path = os.path.abspath(path)
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.moves_log_path = os.path.join(self.path, MOVES_FILE_NAME)
+        self.events = queue.Queue()  # entry names reported by watchdog's thread
+        self.pending = {}  # file name -> ((size, mtime_ns), time it was last seen to change), None until first checked
+        self.skipped = {}  # file name -> (size, mtime_ns) of files left in place because their destination exists
+        self.created_folders = set()
+        self.folders, files = list_folders_and_files(self.path)
+        self.classifier = FileClassifier(self.folders)
+        for file in files:
+            self.pending[file] = None
+
+    def dispatch(self, event):
+        """
+        Called by watchdog for every change in path; queues the names involved for the main loop.
+        """
+        for event_path in (event.src_path, getattr(event, "dest_path", "")):
+            event_path = os.fsdecode(event_path)
+            if event_path and os.path.dirname(os.path.abspath(event_path)) == self.path:
+                self.events.put(os.path.basename(event_path))
+
+    def note(self, name):
+        """
+        Updates the structure folders or the pending files for an entry of path that may have changed.
+        """
+        if name in (PLAN_FILE_NAME, MOVES_FILE_NAME):
+            return
+        if is_structure_folder(name):
+            exists = os.path.exists(os.path.join(self.path, name))
+            if exists != (name in self.folders):
+                if exists:
+                    self.folders.append(name)
+                else:
+                    self.folders.remove(name)
+                self.classifier = FileClassifier(self.folders)
+                print(f"Structure folders: {len(self.folders)} ({'added' if exists else 'removed'} {name})")
+        elif name in self.skipped:
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+                changed = (stat.st_size, stat.st_mtime_ns) != self.skipped[name]
+            except FileNotFoundError:
+                changed = True
+            if changed:
+                del self.skipped[name]
+                self.pending[name] = None
+        elif name not in self.pending:
+            self.pending[name] = None
+
+    def skip(self, file, dest):
+        """
+        Stops retrying a file whose destination already exists, until the file changes.
+        """
+        seen = self.pending.pop(file, None)
+        self.skipped[file] = seen[0] if seen else None
+        print(f"Could not move {file}: {os.path.relpath(dest, self.path)} already exists, leaving it in place")
+
+    def poll(self):
+        """
+        Lists path and notes every entry, for when watchdog is not installed.
+        """
+        for name in set(os.listdir(self.path)) | set(self.folders):
+            self.note(name)
+
+    def route_settled(self):
+        """
+        Moves every pending file whose size and modified time have not changed for settle_seconds.
+        """
+        now = time.monotonic()
+        moves = []
+        for file, seen in list(self.pending.items()):
+            try:
+                stat = os.stat(os.path.join(self.path, file))
+            except FileNotFoundError:
+                del self.pending[file]  # moved or deleted by someone else
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if seen is None or seen[0] != signature:
+                self.pending[file] = (signature, now)
+            elif now - seen[1] >= self.settle_seconds:
+                dest = os.path.join(self.path, self.classifier.route(file), file)
+                if os.path.exists(dest):
+                    self.skip(file, dest)
+                else:
+                    moves.append((os.path.join(self.path, file), dest))
+        if not moves:
+            return
+
+        for dest_folder in {os.path.dirname(dest) for _, dest in moves} - self.created_folders:
+            os.makedirs(dest_folder, exist_ok=True)
+            self.created_folders.add(dest_folder)
+        done, failed = run_moves(moves)
+        for src, dest in done:
+            del self.pending[os.path.basename(src)]
+            print(f"Moved {os.path.basename(src)} to {os.path.relpath(os.path.dirname(dest), self.path)}")
+        for (src, dest), error in failed:
+            if isinstance(error, FileExistsError):
+                self.skip(os.path.basename(src), dest)
+                continue
+            self.pending[os.path.basename(src)] = None  # still locked or being written, wait for it to settle again
+            print(f"Could not move {src} to {dest}, will retry: {error}")
+        write_moves_csv(done, self.moves_log_path, append=True)
+
+    def run(self):
+        """
+        Watches until interrupted with Ctrl+C.
+        """
+        observer = None
+        if Observer is not None:
+            observer = Observer()
+            observer.schedule(self, self.path, recursive=False)
+            observer.start()
+            print(f"Watching {self.path} (Ctrl+C to stop)")
         else:
-            dest = os.path.join(path, file_folder, file_disp, file) #if file is relevent to a specific discipline in a specific folder, send it there
-            if not os.path.exists(os.path.join(path, file_folder, file_disp)):# creates discipline folders if not present
-                os.makedirs(os.path.join(path, file_folder, file_disp))
+            print(f"Polling {self.path} every {self.poll_seconds} s, pip install watchdog to be notified instead (Ctrl+C to stop)")
+        try:
+            while True:
+                if observer is None:
+                    self.poll()
+                deadline = time.monotonic() + self.poll_seconds
+                while time.monotonic() < deadline:
+                    try:
+                        self.note(self.events.get(timeout=max(deadline - time.monotonic(), 0)))
+                    except queue.Empty:
+                        break
+                self.route_settled()
+        except KeyboardInterrupt:
+            print("Stopped watching")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+
+def create_benchmark_names(count=100000, structure_count=40):
+    """
+    Returns synthetic structure folder names and count file names that mostly name one structure,
+    sometimes two or none, plus a discipline code.
+    """
+    random.seed(0)
+    folders = ["_Others"] + [f"{random.choice(['BR', 'RW', 'CV', 'TN', 'ST'])}{i:03d}" for i in range(structure_count)]
+    names = []
+    for i in range(count):
+        structures = random.sample(folders[1:], random.choice([0, 1, 1, 1, 1, 1, 1, 1, 2]))
+        code = random.choice(disciplines)[:3]
+        names.append("-".join(["282442", "ADC", *structures, code, "DWG", f"{i:05d}"]) + ".pdf")
+    return folders, names
+
+
+def benchmark_classifier(count=100000):
+    """
+    Routes count synthetic file names with route_file and with FileClassifier, checks that
+    every decision matches and prints the time taken by each.
+    """
+    folders, names = create_benchmark_names(count)
 
-    os.rename(src, dest) #moves files
+    start = time.perf_counter()
+    expected = [route_file(name, folders) for name in names]
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    classifier = FileClassifier(folders)
+    routed = [classifier.route(name) for name in names]
+    classifier_seconds = time.perf_counter() - start
+
+    mismatches = sum(a != b for a, b in zip(expected, routed))
+    print(f"{count} names, {len(folders)} structures, {len(disciplines)} disciplines")
+    print(f"substring loops: {loop_seconds:6.2f} s")
+    print(f"     classifier: {classifier_seconds:6.2f} s ({loop_seconds / classifier_seconds:.1f}x)")
+    print(f"routing differences: {mismatches}")
+
+
+def main(path):
+    moves, new_folders = plan_moves(path)
+    plan_path = os.path.join(path, PLAN_FILE_NAME)
+    write_moves_csv(moves, plan_path)
+    print(f"Planned {len(moves)} moves into {len(new_folders)} new folders: {plan_path}")
+    if DRY_RUN:
+        return
+    apply_plan(moves, new_folders, os.path.join(path, MOVES_FILE_NAME))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--rollback":
+        moves_log_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(path, MOVES_FILE_NAME)
+        rollback_log(moves_log_path)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--watch":
+        SubmissionWatcher(sys.argv[2] if len(sys.argv) > 2 else path).run()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark_classifier()
+    else:
+        main(path)
 
 
 
@@ -1,69 +1,259 @@
 ####
 #UPDATE PATH BELOW TO WORKING LOCATION !!
 #pip install pypdf
+#Set OPTIMISE_OUTPUT = True to compress each COMBINED PDF after it is written, and LINEARIZE_OUTPUT = True to also
+#make it open page-by-page over SharePoint/VPN ("fast web view"); linearizing needs pip install pikepdf
+#With pikepdf installed, each PDF's whole page tree is appended in one go (BULK_APPEND = True), which is much faster
+#for drawings with many objects per page; a file that fails is retried page by page with pypdf
+#Run "python "PDF merger (ONCorr).py" --benchmark [folder]" to compare both ways on a folder (default: 2,000 synthetic pages)
 ####
 
 
 
 path = r"C:\Users\Mohammed.Hashem\OneDrive - Arup\06-Corridor Submissions\LSW Cordr Pck A 240624"
+OPTIMISE_OUTPUT = False
+LINEARIZE_OUTPUT = False
+BULK_APPEND = True
+import io
 import os
+import sys
+import tempfile
+import time
 from pypdf import PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, NameObject, NumberObject, StreamObject
 
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
 
-# Collect all folder paths
-all_folders = []
-for root, dirs, files in os.walk(path):
-    for name in dirs:
-        all_folders.append(os.path.join(root, name))
-
-# Filter main folders
-main_folders = []
-type_filter = [".pdf", ".py", ".txt"]
-for folder in os.listdir(path):
-    if not any(folder.endswith(x) for x in type_filter):
-        main_folders.append(folder)
-
-# Collect sub-folder paths
-sub_folders = all_folders[len(main_folders):]
-
-# Iterate over sub-folders and merge PDFs
-for sub_folder in sub_folders:
-    head, tail = os.path.split(sub_folder)
-    if tail == "_Others":
-        print(f"Skipping folder: {sub_folder}")
-        continue
-    
-    structure_name = sub_folder.split(f"\\")[-2]
-    files_to_merge = os.listdir(sub_folder)
-    
-    merged_name = ("COMBINED_" + structure_name + "_" + tail[4:] + ".pdf").upper()
-    merged_path = os.path.join(sub_folder, merged_name)
-    
-    if not os.path.exists(merged_path):
-        # print(f"Creating merged PDF: {merged_path}")
-        writer = PdfWriter()
-        
-        for pdf in files_to_merge:
-            if pdf.lower().endswith('.pdf'):
-                pdf_path = os.path.join(sub_folder, pdf)
+
+def optimise_pdf(pdf_path, linearize=LINEARIZE_OUTPUT):
+    """
+    Compresses a merged PDF in place and returns (size before, size after, seconds).
+    pikepdf also packs objects into object streams and can linearize the file;
+    pypdf on its own only compresses the page content streams, and keeps the original
+    if that does not make it smaller.
+    """
+    start = time.perf_counter()
+    size_before = os.path.getsize(pdf_path)
+    if pikepdf is not None:
+        with pikepdf.open(pdf_path, allow_overwriting_input=True) as pdf:
+            pdf.save(
+                pdf_path,
+                compress_streams=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                linearize=linearize,
+            )
+    else:
+        writer = PdfWriter(clone_from=pdf_path)
+        for page in writer.pages:
+            page.compress_content_streams()
+        optimised_path = pdf_path + ".optimised"
+        with open(optimised_path, "wb") as fout:
+            writer.write(fout)
+        # Content streams that were already compressed can come out larger, keep the original then
+        if os.path.getsize(optimised_path) < size_before:
+            os.replace(optimised_path, pdf_path)
+        else:
+            os.remove(optimised_path)
+    return size_before, os.path.getsize(pdf_path), time.perf_counter() - start
+
+
+def iter_discipline_folders(path):
+    """
+    Lazily yields (structure_name, sub_folder) for every folder below the structure folders in path,
+    so merging starts as soon as the first one is found instead of after a full os.walk of the tree.
+    structure_name is the name of the folder directly above sub_folder. Files in path are ignored.
+    _Others folders are skipped together with everything inside them.
+    """
+    with os.scandir(path) as entries:
+        main_folders = [entry.path for entry in entries if entry.is_dir()]
+
+    for main_folder in main_folders:
+        pending = [main_folder]  # depth-first, in the same order os.walk visited them
+        while pending:
+            folder = pending.pop()
+            with os.scandir(folder) as entries:
+                children = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+            for sub_folder in [child for child in children if os.path.basename(child) == "_Others"]:
+                print(f"Skipping folder: {sub_folder}")
+                children.remove(sub_folder)
+            for sub_folder in children:
+                yield os.path.basename(folder), sub_folder
+            pending.extend(reversed(children))
+
+
+def copy_pages(pdf_paths, writer):
+    """
+    Adds the pages of each PDF to a pypdf writer one page at a time, reporting (and skipping)
+    any file that cannot be read.
+    """
+    for pdf_path in pdf_paths:
+        try:
+            # print(f"Appending file: {pdf_path}")
+            reader = PdfReader(pdf_path)
+            for page_num in range(len(reader.pages)):
+                writer.add_page(reader.pages[page_num])
+        except Exception as e:
+            print(f"Failed to append {pdf_path}: {e}")
+
+
+def merge_page_by_page(pdf_paths, merged_path):
+    """
+    Merges PDFs with pypdf, one add_page call per page.
+    """
+    writer = PdfWriter()
+    copy_pages(pdf_paths, writer)
+    with open(merged_path, "wb") as fout:
+        writer.write(fout)
+
+
+def merge_bulk(pdf_paths, merged_path):
+    """
+    Merges PDFs with pikepdf, appending the whole page tree of each file at once so the shared
+    resources of its pages are copied in a single pass. A file that pikepdf cannot open or copy
+    is read page by page with pypdf instead, so one corrupt sheet does not stop the merge.
+    """
+    sources = []
+    try:
+        with pikepdf.new() as merged:
+            for pdf_path in pdf_paths:
+                page_count = len(merged.pages)
                 try:
-                    # print(f"Appending file: {pdf_path}")
-                    reader = PdfReader(pdf_path)
-                    for page_num in range(len(reader.pages)):
-                        writer.add_page(reader.pages[page_num])
+                    source = pikepdf.open(pdf_path)
+                    sources.append(source)
+                    merged.pages.extend(source.pages)
                 except Exception as e:
-                    print(f"Failed to append {pdf_path}: {e}")
+                    del merged.pages[page_count:]
+                    print(f"Bulk append failed for {pdf_path} ({e}), appending page by page")
+                    writer = PdfWriter()
+                    copy_pages([pdf_path], writer)
+                    if not writer.pages:
+                        continue
+                    buffer = io.BytesIO()
+                    writer.write(buffer)
+                    source = pikepdf.open(buffer)
+                    sources.append(source)
+                    merged.pages.extend(source.pages)
+            merged.save(merged_path)
+    finally:
+        for source in sources:
+            source.close()
+
+
+def merge_pdfs(pdf_paths, merged_path, bulk=BULK_APPEND):
+    """
+    Merges pdf_paths into merged_path, using merge_bulk when bulk is True and pikepdf is installed.
+    """
+    if bulk and pikepdf is not None:
+        merge_bulk(pdf_paths, merged_path)
+    else:
+        merge_page_by_page(pdf_paths, merged_path)
+
+
+def merge_sub_folders(path):
+    """
+    Creates COMBINED_<STRUCTURE>_<DISCIPLINE>.PDF in every sub-folder of path that does not have one yet.
+    """
+    if OPTIMISE_OUTPUT and LINEARIZE_OUTPUT and pikepdf is None:
+        print("pikepdf is not installed (pip install pikepdf): merged PDFs will be compressed but not linearized")
+
+    # Iterate over sub-folders and merge PDFs
+    for structure_name, sub_folder in iter_discipline_folders(path):
+        tail = os.path.basename(sub_folder)
+        files_to_merge = os.listdir(sub_folder)
+
+        merged_name = ("COMBINED_" + structure_name + "_" + tail[4:] + ".pdf").upper()
+        merged_path = os.path.join(sub_folder, merged_name)
+
+        if not os.path.exists(merged_path):
+            # print(f"Creating merged PDF: {merged_path}")
+            pdf_paths = []
+            for pdf in files_to_merge:
+                if pdf.lower().endswith('.pdf'):
+                    pdf_paths.append(os.path.join(sub_folder, pdf))
+                else:
+                    print(f"Skipping non-PDF file: {pdf}")
+
+            try:
+                merge_pdfs(pdf_paths, merged_path)
+                # print(f"Successfully created merged PDF: {merged_path}")
+            except Exception as e:
+                print(f"Failed to write merged PDF {merged_path}: {e}")
             else:
-                print(f"Skipping non-PDF file: {pdf}")
+                if OPTIMISE_OUTPUT:
+                    size_before, size_after, seconds = optimise_pdf(merged_path)
+                    print(f"Optimised {merged_name}: {size_before / (1024 * 1024):.1f} MB -> "
+                          f"{size_after / (1024 * 1024):.1f} MB in {seconds:.1f} s")
+        else:
+            print(f"Merged PDF already exists: {merged_path}")
 
-        try:
-            with open(merged_path, "wb") as fout:
-                writer.write(fout)
-            # print(f"Successfully created merged PDF: {merged_path}")
-        except Exception as e:
-            print(f"Failed to write merged PDF {merged_path}: {e}")
+
+def create_benchmark_folder(folder_path, file_count=20, pages_per_file=100, objects_per_page=40):
+    """
+    Writes file_count synthetic PDFs of pages_per_file pages each, every page drawing
+    objects_per_page small form XObjects, like a typical CAD sheet export.
+    """
+    pdf_paths = []
+    for i in range(file_count):
+        writer = PdfWriter()
+        for _ in range(pages_per_file):
+            page = writer.add_blank_page(2384, 1684)  # A1 landscape
+            content = StreamObject()
+            content._data = b" ".join(f"q /X{k} Do Q".encode() for k in range(objects_per_page))
+            page[NameObject("/Contents")] = writer._add_object(content)
+            xobjects = DictionaryObject()
+            for k in range(objects_per_page):
+                form = StreamObject()
+                form._data = f"{k} {k} m {k + 100} {k + 50} l S".encode()
+                form.update({
+                    NameObject("/Type"): NameObject("/XObject"),
+                    NameObject("/Subtype"): NameObject("/Form"),
+                    NameObject("/BBox"): ArrayObject([NumberObject(0), NumberObject(0),
+                                                      NumberObject(2384), NumberObject(1684)]),
+                })
+                xobjects[NameObject(f"/X{k}")] = writer._add_object(form)
+            page[NameObject("/Resources")] = DictionaryObject({NameObject("/XObject"): xobjects})
+        pdf_path = os.path.join(folder_path, f"SHEET-{i:03d}.pdf")
+        with open(pdf_path, "wb") as fout:
+            writer.write(fout)
+        pdf_paths.append(pdf_path)
+    return pdf_paths
+
+
+def benchmark_bulk_append(folder_path=None):
+    """
+    Merges the PDFs of folder_path (or 2,000 synthetic pages) page by page and in bulk,
+    and prints the time taken and pages per second of each.
+    """
+    if pikepdf is None:
+        print("pikepdf is not installed (pip install pikepdf): nothing to compare against")
+        return
+    with tempfile.TemporaryDirectory() as temp_folder:
+        if folder_path:
+            pdf_paths = sorted(os.path.join(folder_path, f) for f in os.listdir(folder_path)
+                               if f.lower().endswith('.pdf') and not f.upper().startswith("COMBINED_"))
+        else:
+            print("Creating synthetic sheets...")
+            pdf_paths = create_benchmark_folder(temp_folder)
+        page_count = sum(len(PdfReader(pdf_path).pages) for pdf_path in pdf_paths)
+        print(f"Merging {len(pdf_paths)} PDFs ({page_count} pages)")
+
+        for bulk in (False, True):
+            merged_path = os.path.join(temp_folder, "COMBINED_BENCHMARK.PDF")
+            start = time.perf_counter()
+            merge_pdfs(pdf_paths, merged_path, bulk)
+            seconds = time.perf_counter() - start
+            mode = "bulk" if bulk else "page by page"
+            print(f"{mode:>12}: {seconds:6.1f} s, {page_count / seconds:6.0f} pages/s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark_bulk_append(sys.argv[2] if len(sys.argv) > 2 else None)
     else:
-        print(f"Merged PDF already exists: {merged_path}")
+        merge_sub_folders(path)
 
 
 
@@ -1,19 +1,33 @@
 ####
 #UPDATE INPUTS BELOW AS NEEDED !!
 #First time users: type "pip install PyPDF2" and "pip install pandas" in the terminal below (VSCode) or in the comand prompt if using Notepad
+#Optional: "pip install pikepdf" so optimise_output can pack and linearize the merged PDF (without it, "pip install pypdf" compresses only the page contents)
 ####
 
 import os
+import time
 from PyPDF2 import PdfMerger
 import zipfile
 import pandas as pd
 import csv
 
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
+
+try:
+    from pypdf import PdfWriter as PypdfWriter #compresses the merged PDF when pikepdf is not installed
+except ImportError:
+    PypdfWriter = None
+
 ###INPUTS####
 folder_path = r"C:\Users\Mohammed.Hashem\Desktop\test" #complete path eg. "C:\Users\XXXXX\Desktop\folder_name"
 txt_file_name = "File_Names.txt"     #just the file name eg. "filenames.txt"
 table_file_name = "CAD_PDF_Check.txt"   #name of the table file (change to .csv if you want excel table, txt for quick and dirty view - recommended)
 file_types_to_track = ["pdf", "dwg"]
+optimise_output = False     #True compresses the merged PDF after writing it
+linearize_output = False    #True also linearizes it (fast web view) so it opens quickly over SharePoint/VPN - needs pikepdf
 
 
 def get_merged_file_name(folder_path):
@@ -66,6 +80,38 @@ def merge_pdfs_with_marker(file_list, marker, merged_file_name, folder_path):
     merged_file_path = os.path.join(folder_path, merged_file_name)
     with open(merged_file_path, 'wb') as output_file:
         merger.write(output_file)
+    return merged_file_path
+
+
+def optimise_pdf(pdf_path, linearize=False):
+    """
+    Shrinks the merged PDF in place and returns (size before, size after, seconds)
+    Uses pikepdf (object streams + optional linearization) when installed, otherwise pypdf content stream compression only,
+    keeping the original if that does not make it smaller
+    """
+    start = time.perf_counter()
+    size_before = os.path.getsize(pdf_path)
+    if pikepdf is not None:
+        with pikepdf.open(pdf_path, allow_overwriting_input=True) as pdf:
+            pdf.save(pdf_path, compress_streams=True,
+                     object_stream_mode=pikepdf.ObjectStreamMode.generate, linearize=linearize)
+    elif PypdfWriter is not None:
+        if linearize:
+            print("pikepdf is not installed: compressing the merged PDF without linearizing it")
+        writer = PypdfWriter(clone_from=pdf_path)
+        for page in writer.pages:
+            if "/Contents" in page: #blank sheets have no contents to compress
+                page.compress_content_streams()
+        optimised_path = pdf_path + '.optimised'
+        with open(optimised_path, 'wb') as output_file:
+            writer.write(output_file)
+        if os.path.getsize(optimised_path) < size_before: #already compressed streams can come out larger, keep the original then
+            os.replace(optimised_path, pdf_path)
+        else:
+            os.remove(optimised_path)
+    else:
+        print("Neither pikepdf nor pypdf is installed: the merged PDF was not optimised")
+    return size_before, os.path.getsize(pdf_path), time.perf_counter() - start
 
 
 def unzip_zip_files(folder_path):
@@ -135,7 +181,10 @@ unzip_zip_files(folder_path) #unzips the CAD files
 file_names = list_tracked_files_in_folder(folder_path, file_types_to_track) #all files .pdf or .dwg
 write_list_to_txt(file_names, txt_file_name, folder_path) #prints all the tracked file names to a txt file
 merged_file_name = get_merged_file_name(folder_path) # determines merged file name based on package name
-merge_pdfs_with_marker(file_names, "DWG", merged_file_name, folder_path) #merges all DWG.pdfs (in order)
+merged_file_path = merge_pdfs_with_marker(file_names, "DWG", merged_file_name, folder_path) #merges all DWG.pdfs (in order)
+if optimise_output:
+    size_before, size_after, seconds = optimise_pdf(merged_file_path, linearize_output)
+    print(f"Optimised {merged_file_name}: {size_before / (1024 * 1024):.1f} MB -> {size_after / (1024 * 1024):.1f} MB in {seconds:.1f} s")
 df = unique_file_df(file_names, "DWG") #creates table of CAD and PDF comparison
 if table_file_name.endswith(".txt"):
     print_df_to_txt(df, table_file_name, folder_path)
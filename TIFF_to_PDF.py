@@ -1,70 +1,492 @@
+import io
+import itertools
+import math
 import os
-from PIL import Image #pip install pillow
-from pypdf import PdfWriter, PdfReader #pip install pypdf
+import sys
+import tempfile
+import time
+from multiprocessing import Process, Queue
+from PIL import Image, ImageOps #pip install pillow
+from pypdf import PdfReader, PdfWriter #pip install pypdf
+from pypdf.generic import ArrayObject, BooleanObject, DictionaryObject, FloatObject, IndirectObject, NameObject, NumberObject, StreamObject
 from tqdm import tqdm #pip install tqdm
 
+try:
+    import pikepdf #pip install pikepdf (optional, needed for object streams and linearization)
+except ImportError:
+    pikepdf = None
+
+# Compress each combined PDF after it is written, and linearize it so the first scan shows while the rest downloads
+OPTIMISE_OUTPUT = False
+LINEARIZE_OUTPUT = False
+
+# Embed black-and-white (1-bit) scans as CCITT Group 4 instead of converting them to RGB JPEG. Group 4 TIFFs are
+# copied without decoding, and the page is turned with the PDF /Rotate entry instead of rotating the pixels
+PASSTHROUGH_BILEVEL = True
+
+# Turn every page with the PDF /Rotate entry instead of rotating the pixels, so the original raster is kept
+ROTATE_WITH_PAGE = True
+
+# Scans are turned a quarter turn counter-clockwise (/Rotate 270), unless their TIFF/EXIF orientation tag says
+# otherwise: these tag values map to a clockwise /Rotate, the mirrored ones are flipped in the pixels
+ORIENTATION_TAG = 0x0112
+ORIENTATION_ROTATION = {3: 180, 6: 90, 8: 270}
+MIRRORED_ORIENTATIONS = (2, 4, 5, 7)
+DEFAULT_ROTATION = 270
+
 # Increase the maximum image size limit to handle large images
+# (scans are converted one at a time, so memory is bounded by the largest single scan)
 Image.MAX_IMAGE_PIXELS = None
 
-def process_tiff_files_in_subfolder(subfolder_path):
-    tiff_images = []
+class G4Scan:
+    """
+    A black-and-white scan held as a single CCITT Group 4 strip, ready to embed in a PDF
+    without decoding.
+    """
+
+    def __init__(self, data, width, height, black_is_1):
+        self.data = data
+        self.width = width
+        self.height = height
+        self.black_is_1 = black_is_1
+
+def copy_g4_strip(img):
+    """
+    Returns a G4Scan with the compressed data of a single-strip Group 4 TIFF, read straight from
+    the file, or None if the image is stored any other way.
+    """
+    if img.format != 'TIFF' or img.info.get('compression') != 'group4':
+        return None
+    offsets = img.tag_v2.get(273, ())
+    if len(offsets) != 1 or img.tag_v2.get(266, 1) != 1:  # one strip, most significant bit first
+        return None
+    img.fp.seek(offsets[0])
+    data = img.fp.read(img.tag_v2[279][0])
+    # The size as stored (img.size may already account for the orientation tag)
+    width, height = img.tag_v2[256], img.tag_v2[257]
+    # With BlackIsZero (photometric 1) the coded "white" runs are 0 bits, which PDF calls BlackIs1
+    return G4Scan(data, width, height, img.tag_v2.get(262, 0) == 1)
+
+def encode_g4_scan(image):
+    """
+    Returns a G4Scan for a decoded 1-bit image (several strips, other compression, or flipped),
+    re-encoded as one Group 4 strip in memory.
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, 'TIFF', compression='group4', strip_size=math.ceil(image.width / 8) * image.height)
+    buffer.seek(0)
+    with Image.open(buffer) as encoded:
+        scan = copy_g4_strip(encoded)
+    if scan is None:
+        raise ValueError("could not encode the image as a single Group 4 strip")
+    return scan
 
-    # Collect all TIFF images in the subfolder
+def load_scan(img):
+    """
+    Decodes a scan and returns it with the clockwise angle it should be displayed at.
+    Scans without an orientation tag get DEFAULT_ROTATION. Tagged scans are displayed the way
+    the tag says: recent Pillow versions turn the pixels while loading, otherwise the angle
+    carries the turn, and mirrored orientations (which /Rotate cannot express) are flipped.
+    """
+    orientation = img.getexif().get(ORIENTATION_TAG, 1)
+    img.load()
+    if orientation == 1:
+        return img, DEFAULT_ROTATION
+    if ORIENTATION_TAG not in img.getexif():  # already applied by Pillow
+        return img, 0
+    if orientation in MIRRORED_ORIENTATIONS:
+        return ImageOps.exif_transpose(img), 0
+    return img, ORIENTATION_ROTATION.get(orientation, 0)
+
+def process_tiff_files_in_subfolder(subfolder_path):
+    """
+    Yields (page, rotate) for the TIFF images in the subfolder one at a time, where rotate is
+    the clockwise page rotation in degrees (see load_scan).
+    Each scan is only opened once the previous page has been written, so a folder of
+    large scans never has more than one decoded image in memory.
+    With PASSTHROUGH_BILEVEL, black-and-white scans are yielded as G4Scan pages, which for
+    Group 4 TIFFs avoids decoding them at all. With ROTATE_WITH_PAGE (always for G4Scan pages)
+    the raster is kept as scanned and turned by /Rotate; otherwise the pixels are rotated
+    and rotate is 0.
+    """
     for file in os.listdir(subfolder_path):
         if file.lower().endswith('.tiff') or file.lower().endswith('.tif'):
             file_path = os.path.join(subfolder_path, file)
             try:
-                # Open the image and rotate it counter-clockwise
-                img = Image.open(file_path)
-                rotated_img = img.rotate(90, expand=True)
-                tiff_images.append(rotated_img)
+                with Image.open(file_path) as img:
+                    page = None
+                    orientation = img.getexif().get(ORIENTATION_TAG, 1)
+                    if PASSTHROUGH_BILEVEL and img.mode == '1' and orientation not in MIRRORED_ORIENTATIONS:
+                        # Copied without decoding, so the orientation tag is applied with /Rotate too
+                        page = copy_g4_strip(img)
+                        rotate = ORIENTATION_ROTATION.get(orientation, DEFAULT_ROTATION)
+                    if page is None:
+                        page, rotate = load_scan(img)
+                        if PASSTHROUGH_BILEVEL and page.mode == '1':
+                            page = encode_g4_scan(page)
+                        elif not ROTATE_WITH_PAGE and rotate:
+                            # Rotate the pixels instead (Pillow turns counter-clockwise)
+                            page, rotate = page.rotate(-rotate, expand=True), 0
             except Image.DecompressionBombError:
                 print(f"Skipped {file_path}: Image too large.")
+                continue
             except Exception as e:
                 print(f"Skipped {file_path}: {e}")
+                continue
+            yield page, rotate
+            del page  # free this page before the next scan is decoded
 
-    return tiff_images
+class ImagePdfWriter:
+    """
+    Writes a PDF with one image per page straight to the output file.
 
-def save_images_as_pdf(images, output_pdf_path):
-    pdf_writer = PdfWriter()
+    Each image is encoded in memory and written out as soon as it is added, so only the current
+    page is held, and nothing is read back: the page tree and the single cross-reference table
+    are written by close(). Pages are sized like Pillow's PDF output, one point per pixel at
+    the default resolution of 72 dpi.
+    """
+
+    def __init__(self, output_file, resolution=72.0):
+        self.output_file = output_file
+        self.resolution = resolution
+        self.offsets = [0]  # Object 0 is the head of the free list
+        self.page_ids = []
+        self.output_file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.pages_id = self._reserve_id()
+
+    def _reserve_id(self):
+        self.offsets.append(None)
+        return len(self.offsets) - 1
+
+    def _write_object(self, pdf_object):
+        object_id = self._reserve_id()
+        self.offsets[object_id] = self.output_file.tell()
+        self.output_file.write(f"{object_id} 0 obj\n".encode())
+        pdf_object.write_to_stream(self.output_file)
+        self.output_file.write(b"\nendobj\n")
+        return IndirectObject(object_id, 0, None)
+
+    def _encode_image(self, image):
+        """
+        Returns the image XObject for image: JPEG for greyscale and RGB, as Pillow's PDF output does.
+        """
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG')
+        xobject = StreamObject()
+        xobject._data = buffer.getvalue()
+        xobject.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(image.width),
+            NameObject("/Height"): NumberObject(image.height),
+            NameObject("/ColorSpace"): NameObject("/DeviceGray" if image.mode == 'L' else "/DeviceRGB"),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+            NameObject("/Filter"): NameObject("/DCTDecode"),
+        })
+        return xobject
+
+    def add_image(self, image, rotate=0):
+        """
+        Appends image as a new page the size of the image, displayed turned clockwise by rotate degrees.
+        """
+        self._add_page(self._encode_image(image), image.width, image.height, rotate)
+
+    def add_g4_scan(self, scan, rotate=0):
+        """
+        Appends a G4Scan as a new page, embedding its Group 4 data as it is.
+        """
+        xobject = StreamObject()
+        xobject._data = scan.data
+        xobject.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(scan.width),
+            NameObject("/Height"): NumberObject(scan.height),
+            NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+            NameObject("/BitsPerComponent"): NumberObject(1),
+            NameObject("/Filter"): NameObject("/CCITTFaxDecode"),
+            NameObject("/DecodeParms"): DictionaryObject({
+                NameObject("/K"): NumberObject(-1),
+                NameObject("/Columns"): NumberObject(scan.width),
+                NameObject("/Rows"): NumberObject(scan.height),
+                NameObject("/BlackIs1"): BooleanObject(scan.black_is_1),
+            }),
+        })
+        self._add_page(xobject, scan.width, scan.height, rotate)
 
-    for image in tqdm(images, desc="Processing images", unit="image"):
-        # Convert image to RGB mode (required for saving as PDF)
-        img_rgb = image.convert('RGB')
-        # Save the image temporarily as a PDF
-        img_temp_path = 'temp_image.pdf'
-        img_rgb.save(img_temp_path)
+    def _add_page(self, xobject, pixel_width, pixel_height, rotate=0):
+        width = pixel_width * 72.0 / self.resolution
+        height = pixel_height * 72.0 / self.resolution
+        xobject_ref = self._write_object(xobject)
+        contents = StreamObject()
+        contents._data = f"q {width:.4f} 0 0 {height:.4f} 0 0 cm /Im0 Do Q".encode()
+        contents_ref = self._write_object(contents)
+        page = DictionaryObject({
+            NameObject("/Type"): NameObject("/Page"),
+            NameObject("/Parent"): IndirectObject(self.pages_id, 0, None),
+            NameObject("/MediaBox"): ArrayObject([NumberObject(0), NumberObject(0),
+                                                  FloatObject(width), FloatObject(height)]),
+            NameObject("/Resources"): DictionaryObject({
+                NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): xobject_ref}),
+            }),
+            NameObject("/Contents"): contents_ref,
+        })
+        if rotate:
+            page[NameObject("/Rotate")] = NumberObject(rotate)
+        self.page_ids.append(self._write_object(page).idnum)
 
-        # Read the temporary PDF and add its pages to the PdfWriter
-        with open(img_temp_path, 'rb') as img_temp_file:
-            pdf_reader = PdfReader(img_temp_file)
-            for page in pdf_reader.pages:
-                pdf_writer.add_page(page)
+    def close(self):
+        """
+        Write the page tree, catalog and cross-reference table. The output file is left open.
+        """
+        self.offsets[self.pages_id] = self.output_file.tell()
+        self.output_file.write(f"{self.pages_id} 0 obj\n".encode())
+        DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(IndirectObject(page_id, 0, None) for page_id in self.page_ids),
+            NameObject("/Count"): NumberObject(len(self.page_ids)),
+        }).write_to_stream(self.output_file)
+        self.output_file.write(b"\nendobj\n")
+        catalog_ref = self._write_object(DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(self.pages_id, 0, None),
+        }))
 
-        # Remove the temporary file
-        os.remove(img_temp_path)
+        xref_offset = self.output_file.tell()
+        self.output_file.write(f"xref\n0 {len(self.offsets)}\n0000000000 65535 f \n".encode())
+        for offset in self.offsets[1:]:
+            self.output_file.write(f"{offset:010d} 00000 n \n".encode())
+        self.output_file.write(
+            f"trailer\n<< /Size {len(self.offsets)} /Root {catalog_ref.idnum} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+        )
 
-    # Write all collected pages to the final PDF
+def save_images_as_pdf(images, output_pdf_path):
+    """
+    Converts each (image, rotate) pair from process_tiff_files_in_subfolder and writes it to
+    output_pdf_path as soon as it arrives, so images can be a generator and only the current
+    page is ever held in memory. Returns the number of pages written.
+    """
     with open(output_pdf_path, 'wb') as output_pdf_file:
-        pdf_writer.write(output_pdf_file)
+        pdf_writer = ImagePdfWriter(output_pdf_file)
+        for image, rotate in tqdm(images, desc="Processing images", unit="image"):
+            if isinstance(image, G4Scan):
+                pdf_writer.add_g4_scan(image, rotate)
+                continue
+            # Convert image to RGB mode (required for saving as PDF)
+            img_rgb = image.convert('RGB')
+            del image
+            pdf_writer.add_image(img_rgb, rotate)
+            del img_rgb
+        pdf_writer.close()
+    return len(pdf_writer.page_ids)
+
+def optimise_pdf(pdf_path, linearize=LINEARIZE_OUTPUT):
+    """
+    Recompresses a combined PDF in place and returns (size before, size after, seconds).
+    With pikepdf the objects go into object streams and the file can be linearized;
+    otherwise pypdf compresses the page content streams only, and the original is kept
+    if that does not make it smaller.
+    """
+    start = time.perf_counter()
+    size_before = os.path.getsize(pdf_path)
+    if pikepdf is not None:
+        with pikepdf.open(pdf_path, allow_overwriting_input=True) as pdf:
+            pdf.save(
+                pdf_path,
+                compress_streams=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                linearize=linearize,
+            )
+    else:
+        pdf_writer = PdfWriter(clone_from=pdf_path)
+        for page in pdf_writer.pages:
+            page.compress_content_streams()
+        optimised_path = pdf_path + '.optimised'
+        with open(optimised_path, 'wb') as output_pdf_file:
+            pdf_writer.write(output_pdf_file)
+        # Content streams that were already compressed can come out larger, keep the original then
+        if os.path.getsize(optimised_path) < size_before:
+            os.replace(optimised_path, pdf_path)
+        else:
+            os.remove(optimised_path)
+    return size_before, os.path.getsize(pdf_path), time.perf_counter() - start
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of the current process in MB, or None if it cannot be measured.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil  # Windows: pip install psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+def run_conversion_for_benchmark(subfolder_path, output_pdf_path, hold_all, results):
+    """
+    Converts a folder in a fresh process and reports (seconds, peak RSS in MB) back through results.
+    With hold_all=True every scan is collected into a list first, as the script used to do.
+    """
+    start = time.perf_counter()
+    images = process_tiff_files_in_subfolder(subfolder_path)
+    save_images_as_pdf(list(images) if hold_all else images, output_pdf_path)
+    results.put((time.perf_counter() - start, peak_rss_mb()))
+
+def create_benchmark_scans(folder_path, scan_count=6, width=20000, height=14000):
+    """
+    Writes scan_count synthetic greyscale scans of width x height pixels (deflate-compressed TIFFs
+    with a border and some drawing lines, so they stay small on disk).
+    """
+    from PIL import ImageDraw
+    for i in range(scan_count):
+        scan = Image.new('L', (width, height), 255)
+        draw = ImageDraw.Draw(scan)
+        draw.rectangle((200, 200, width - 200, height - 200), outline=0, width=20)
+        for y in range(1000 + i * 100, height - 1000, 1500):
+            draw.line((1000, y, width - 1000, y), fill=0, width=8)
+        scan.save(os.path.join(folder_path, f"SCAN-{i:03d}.tif"), compression='tiff_deflate')
+        scan.close()
+
+def benchmark_memory(folder_path=None):
+    """
+    Converts the same scans holding every image first (the old behaviour) and streaming
+    one page at a time, each in its own process, and prints the time taken and peak RSS of each.
+    """
+    with tempfile.TemporaryDirectory() as temp_folder:
+        if not folder_path:
+            print("Creating synthetic 20000 x 14000 scans...")
+            folder_path = temp_folder
+            create_benchmark_scans(folder_path)
+        scan_count = sum(f.lower().endswith(('.tif', '.tiff')) for f in os.listdir(folder_path))
+        print(f"Converting {scan_count} scans")
+
+        for hold_all in (True, False):
+            results = Queue()
+            output_pdf_path = os.path.join(temp_folder, "benchmark_COMBINED.pdf")
+            process = Process(target=run_conversion_for_benchmark,
+                              args=(folder_path, output_pdf_path, hold_all, results))
+            process.start()
+            seconds, peak_mb = results.get()
+            process.join()
+            mode = "hold all" if hold_all else "streaming"
+            peak = f"{peak_mb:.0f} MB" if peak_mb is not None else "n/a (pip install psutil)"
+            print(f"{mode:>10}: {seconds:6.1f} s, peak RSS {peak}")
+
+def benchmark_page_latency(folder_path=None, page_count=30, width=6000, height=4200):
+    """
+    Times writing the same pages three ways and prints the average time per page (including the
+    final write) and the average over the last 10 pages:
+    the old temp_image.pdf round trip through pypdf, Pillow's per-page PDF append, and ImagePdfWriter.
+    Pages come from the TIFFs in folder_path, or are page_count synthetic width x height scans.
+    """
+    from PIL import ImageDraw
+
+    def pages():
+        if folder_path:
+            for file in sorted(os.listdir(folder_path)):
+                if file.lower().endswith(('.tif', '.tiff')):
+                    with Image.open(os.path.join(folder_path, file)) as img:
+                        yield img.convert('RGB')
+            return
+        for i in range(page_count):
+            page = Image.new('RGB', (width, height), 'white')
+            draw = ImageDraw.Draw(page)
+            for y in range(100 + i, height - 100, 150):
+                draw.line((100, y, width - 100, y), fill='black', width=4)
+            yield page
+
+    def temp_round_trip(temp_folder, output_pdf_path):
+        pdf_writer = PdfWriter()
+        img_temp_path = os.path.join(temp_folder, 'temp_image.pdf')
+
+        def add(image):
+            image.save(img_temp_path)
+            with open(img_temp_path, 'rb') as img_temp_file:
+                for page in PdfReader(img_temp_file).pages:
+                    pdf_writer.add_page(page)
+            os.remove(img_temp_path)
+
+        def finish():
+            with open(output_pdf_path, 'wb') as output_pdf_file:
+                pdf_writer.write(output_pdf_file)
+        return add, finish
+
+    def pillow_append(temp_folder, output_pdf_path):
+        written = []
+
+        def add(image):
+            image.save(output_pdf_path, format='PDF', append=bool(written))
+            written.append(True)
+        return add, lambda: None
+
+    def direct(temp_folder, output_pdf_path):
+        output_pdf_file = open(output_pdf_path, 'wb')
+        pdf_writer = ImagePdfWriter(output_pdf_file)
+
+        def finish():
+            pdf_writer.close()
+            output_pdf_file.close()
+        return pdf_writer.add_image, finish
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        for name, method in (("temp_image.pdf", temp_round_trip), ("Pillow append", pillow_append),
+                             ("ImagePdfWriter", direct)):
+            output_pdf_path = os.path.join(temp_folder, "benchmark_COMBINED.pdf")
+            add, finish = method(temp_folder, output_pdf_path)
+            latencies = []
+            for page in pages():
+                start = time.perf_counter()
+                add(page)
+                latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            finish()
+            finish_seconds = time.perf_counter() - start
+            per_page = (sum(latencies) + finish_seconds) / len(latencies) * 1000
+            last_pages = sum(latencies[-10:]) / len(latencies[-10:]) * 1000
+            size_mb = os.path.getsize(output_pdf_path) / (1024 * 1024)
+            print(f"{name:>15}: {per_page:7.1f} ms/page, last 10 pages {last_pages:7.1f} ms/page, "
+                  f"{len(latencies)} pages, {size_mb:.1f} MB")
 
 def main():
     base_folder_path = r"C:\Users\Mohammed.Hashem\Desktop\TPH02011SCANS"  # Replace with the path to your folder
 
+    if OPTIMISE_OUTPUT and LINEARIZE_OUTPUT and pikepdf is None:
+        print("pikepdf is not installed (pip install pikepdf): PDFs will be compressed but not linearized")
+
     # Walk through all subdirectories in the base folder
     for root, dirs, files in os.walk(base_folder_path):
         for subfolder in tqdm(dirs, desc="Processing subfolders", unit="subfolder"):
             subfolder_path = os.path.join(root, subfolder)
             tiff_images = process_tiff_files_in_subfolder(subfolder_path)
-            if tiff_images:
+            first_image = next(tiff_images, None)
+            if first_image is not None:
                 # Extract the portion of the subfolder name after the hyphen and up to the first space
                 subfolder_name_parts = subfolder.split(' - ')
                 output_pdf_name = f"{subfolder_name_parts[1]}_COMBINED.pdf"
                 
 
                 output_pdf_path = os.path.join(subfolder_path, output_pdf_name)
+                tiff_images = itertools.chain([first_image], tiff_images)
+                del first_image
                 save_images_as_pdf(tiff_images, output_pdf_path)
                 print(f"PDF created successfully at {output_pdf_path}")
+                if OPTIMISE_OUTPUT:
+                    size_before, size_after, seconds = optimise_pdf(output_pdf_path)
+                    print(f"Optimised {output_pdf_name}: {size_before / (1024 * 1024):.1f} MB -> "
+                          f"{size_after / (1024 * 1024):.1f} MB in {seconds:.1f} s")
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark_memory(sys.argv[2] if len(sys.argv) > 2 else None)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--benchmark-latency":
+        benchmark_page_latency(sys.argv[2] if len(sys.argv) > 2 else None)
+    else:
+        main()